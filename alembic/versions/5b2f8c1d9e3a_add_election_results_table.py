@@ -0,0 +1,34 @@
+"""Add election results table
+
+Revision ID: 5b2f8c1d9e3a
+Revises: 0d0f30daff78
+Create Date: 2026-10-17 10:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2f8c1d9e3a'
+down_revision = '0d0f30daff78'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('election_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('election_id', sa.Integer(), nullable=True),
+    sa.Column('ballot_version', sa.String(length=255), nullable=True),
+    sa.Column('final', sa.Boolean(), nullable=True),
+    sa.Column('results', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['election_id'], ['elections.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('election_id'),
+    sa.UniqueConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('election_results')
@@ -0,0 +1,61 @@
+"""Add lookup indexes
+
+Revision ID: 8e4a7c2b6f10
+Revises: 5b2f8c1d9e3a
+Create Date: 2026-10-17 14:02:19.871204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a7c2b6f10'
+down_revision = '5b2f8c1d9e3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate rows before they are made impossible, keeping the oldest row and whether
+    # any of the duplicates had voted
+    op.execute('UPDATE eligible_voters e JOIN ('
+               '  SELECT MIN(id) AS id, MAX(voted) AS voted FROM eligible_voters'
+               '  GROUP BY election_id, member_id HAVING COUNT(*) > 1) d ON e.id = d.id '
+               'SET e.voted = d.voted')
+    op.execute('DELETE e FROM eligible_voters e JOIN eligible_voters k '
+               'ON k.election_id = e.election_id AND k.member_id = e.member_id AND k.id < e.id')
+    op.execute('DELETE a FROM attendees a JOIN attendees k '
+               'ON k.meeting_id = a.meeting_id AND k.member_id = a.member_id AND k.id < a.id')
+    op.create_unique_constraint('uq_eligible_voters_election_member', 'eligible_voters',
+                                ['election_id', 'member_id'])
+    op.create_unique_constraint('uq_attendees_meeting_member', 'attendees',
+                                ['meeting_id', 'member_id'])
+    op.create_index('ix_rankings_vote_rank', 'rankings', ['vote_id', 'rank', 'candidate_id'])
+    op.create_index('ix_roles_member_committee_role', 'roles',
+                    ['member_id', 'committee_id', 'role'])
+
+
+def downgrade():
+    # MySQL may have dropped the index each foreign key was created with once the composite indexes
+    # below could serve it, and it refuses to drop an index a foreign key still needs. Give the
+    # foreign key its own index again before dropping the composite one.
+    ensure_foreign_key_index('roles', 'member_id', 'ix_roles_member_committee_role')
+    op.drop_index('ix_roles_member_committee_role', 'roles')
+    ensure_foreign_key_index('rankings', 'vote_id', 'ix_rankings_vote_rank')
+    op.drop_index('ix_rankings_vote_rank', 'rankings')
+    ensure_foreign_key_index('attendees', 'meeting_id', 'uq_attendees_meeting_member')
+    op.drop_constraint('uq_attendees_meeting_member', 'attendees', type_='unique')
+    ensure_foreign_key_index('eligible_voters', 'election_id', 'uq_eligible_voters_election_member')
+    op.drop_constraint('uq_eligible_voters_election_member', 'eligible_voters', type_='unique')
+
+
+def ensure_foreign_key_index(table, column, dropping):
+    """
+    Creates an index on column unless an index other than the one being dropped already starts
+    with it
+    """
+    indexes = sa.inspect(op.get_bind()).get_indexes(table)
+    if not any(index['column_names'][:1] == [column] and index['name'] != dropping
+               for index in indexes):
+        op.create_index('ix_{}_{}'.format(table, column), table, [column])
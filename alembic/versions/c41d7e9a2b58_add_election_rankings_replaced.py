@@ -0,0 +1,25 @@
+"""Add election rankings replaced
+
+Revision ID: c41d7e9a2b58
+Revises: 8e4a7c2b6f10
+Create Date: 2026-10-17 16:40:08.512377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9a2b58'
+down_revision = '8e4a7c2b6f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('elections', sa.Column('rankings_replaced', sa.Integer(), nullable=False,
+                                         server_default='0'))
+
+
+def downgrade():
+    op.drop_column('elections', 'rankings_replaced')
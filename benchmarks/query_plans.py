@@ -0,0 +1,182 @@
+"""
+Shows the query plans and timings of the hot lookups with and without the lookup indexes.
+
+    python -m benchmarks.query_plans --members 20000 --output results.json
+
+A copy of the schema is created without the indexes and constraints named in INDEXES, seeded and
+queried, and then the same is done with the full schema. The tables are created in
+--database-url, which defaults to a scratch SQLite file, so point it at an empty database only.
+SQLite does not index foreign keys by itself, so the plans before the indexes are slower there than
+on MySQL.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import MetaData, create_engine, text  # noqa: E402
+
+from membership.database.base import metadata  # noqa: E402
+import membership.database.models  # noqa: E402,F401
+
+# the indexes and unique constraints added for the lookups below
+INDEXES = ['uq_eligible_voters_election_member', 'uq_attendees_meeting_member',
+           'ix_rankings_vote_rank', 'ix_roles_member_committee_role']
+
+QUERIES = {
+    'eligibility': 'SELECT id, voted FROM eligible_voters '
+                   'WHERE member_id = :member_id AND election_id = :election_id',
+    'eligible_list': 'SELECT member_id FROM eligible_voters '
+                     'WHERE election_id = :election_id ORDER BY member_id',
+    'attendance': 'SELECT id FROM attendees '
+                  'WHERE meeting_id = :meeting_id AND member_id = :member_id',
+    'ballots': 'SELECT rankings.vote_id, rankings.candidate_id FROM rankings '
+               'JOIN votes ON rankings.vote_id = votes.id WHERE votes.election_id = :election_id '
+               'ORDER BY rankings.vote_id, rankings.rank, rankings.id',
+    'permissions': 'SELECT committee_id, role FROM roles WHERE member_id = :member_id',
+}
+
+
+def build_schema(with_indexes):
+    """
+    Copies the application's tables, leaving out the lookup indexes unless with_indexes is set
+    """
+    schema = MetaData()
+    for table in metadata.sorted_tables:
+        copy = table.tometadata(schema)
+        if not with_indexes:
+            copy.indexes = {index for index in copy.indexes if index.name not in INDEXES}
+            copy.constraints = {constraint for constraint in copy.constraints
+                                if constraint.name not in INDEXES}
+    return schema
+
+
+def seed(conn, schema, members, meetings, elections, candidates, rng):
+    tables = schema.tables
+    conn.execute(tables['members'].insert(),
+                 [{'id': i + 1, 'first_name': 'Member', 'last_name': str(i)}
+                  for i in range(members)])
+    conn.execute(tables['committees'].insert(), [{'id': i + 1, 'name': str(i)} for i in range(5)])
+    conn.execute(tables['roles'].insert(),
+                 [{'member_id': i + 1, 'role': 'member', 'committee_id': rng.randint(1, 5)}
+                  for i in range(members)])
+    conn.execute(tables['meetings'].insert(),
+                 [{'id': i + 1, 'short_id': i + 1, 'name': str(i)} for i in range(meetings)])
+    conn.execute(tables['attendees'].insert(),
+                 [{'meeting_id': meeting + 1, 'member_id': member + 1}
+                  for meeting in range(meetings)
+                  for member in rng.sample(range(members), members // 4)])
+    conn.execute(tables['elections'].insert(),
+                 [{'id': i + 1, 'name': str(i), 'number_winners': 1} for i in range(elections)])
+    vote_id = 0
+    for election in range(1, elections + 1):
+        candidate_ids = [(election - 1) * candidates + c + 1 for c in range(candidates)]
+        conn.execute(tables['candidates'].insert(),
+                     [{'id': cid, 'member_id': cid, 'election_id': election}
+                      for cid in candidate_ids])
+        voters = rng.sample(range(1, members + 1), members // 2)
+        conn.execute(tables['eligible_voters'].insert(),
+                     [{'member_id': member_id, 'election_id': election, 'voted': True}
+                      for member_id in voters])
+        votes = [{'id': vote_id + i + 1, 'vote_key': i, 'election_id': election}
+                 for i in range(len(voters))]
+        vote_id += len(votes)
+        conn.execute(tables['votes'].insert(), votes)
+        conn.execute(tables['rankings'].insert(),
+                     [{'vote_id': vote['id'], 'rank': rank, 'candidate_id': cid}
+                      for vote in votes
+                      for rank, cid in enumerate(rng.sample(candidate_ids, rng.randint(1, 4)))])
+
+
+def explain(conn, query, params):
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    return [[str(value) for value in row] for row in conn.execute(text(prefix + query), params)]
+
+
+def time_query(conn, query, params, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(query), params).fetchall()
+        runs.append(time.perf_counter() - start)
+    return min(runs)
+
+
+def measure(engine, with_indexes, args):
+    schema = build_schema(with_indexes)
+    schema.drop_all(engine)
+    schema.create_all(engine)
+    with engine.begin() as conn:
+        seed(conn, schema, args.members, args.meetings, args.elections, args.candidates,
+             random.Random(args.seed))
+    params = {'member_id': args.members // 2, 'election_id': 1, 'meeting_id': 1}
+    results = {}
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute('ANALYZE')
+        for name, query in QUERIES.items():
+            results[name] = {'plan': explain(conn, query, params),
+                             'seconds': time_query(conn, query, params, args.repeat)}
+    schema.drop_all(engine)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--meetings', type=int, default=20)
+    parser.add_argument('--elections', type=int, default=3)
+    parser.add_argument('--candidates', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='run every query this many times and keep the fastest run')
+    parser.add_argument('--database-url',
+                        help='an empty database to create the tables in (default: a SQLite file)')
+    parser.add_argument('--database-path', default='query_plans.sqlite')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    scratch = args.database_url is None
+    if scratch:
+        if os.path.exists(args.database_path):
+            os.remove(args.database_path)
+        engine = create_engine('sqlite:///' + args.database_path)
+    else:
+        engine = create_engine(args.database_url)
+    try:
+        before = measure(engine, False, args)
+        after = measure(engine, True, args)
+    finally:
+        engine.dispose()
+        if scratch:
+            os.remove(args.database_path)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': engine.url.drivername,
+        'parameters': {'members': args.members,
+                       'meetings': args.meetings,
+                       'elections': args.elections,
+                       'candidates': args.candidates,
+                       'seed': args.seed},
+        'results': {name: {'before': before[name], 'after': after[name],
+                           'speedup': before[name]['seconds'] / after[name]['seconds']}
+                    for name in QUERIES},
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
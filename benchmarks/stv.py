@@ -0,0 +1,137 @@
+"""
+Times the STV engines on synthetic elections, in memory and through the database.
+
+    python -m benchmarks.stv --ballots 20000 --candidates 20 --winners 5 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from benchmarks.synthetic import RANKING_LENGTHS, generate_election  # noqa: E402
+from membership.database.base import metadata  # noqa: E402
+from membership.database.models import Candidate, Election, Member, Ranking, Vote  # noqa: E402
+from membership.util.vote import (  # noqa: E402
+    ArraySTVElection, GroupedSTVElection, IncrementalSTVElection, STVElection)
+from membership.web.elections import hold_election  # noqa: E402
+
+ENGINES = [STVElection, IncrementalSTVElection, GroupedSTVElection, ArraySTVElection]
+
+
+def time_engine(engine, candidates, num_winners, ballots):
+    """
+    Loads and counts an election one round at a time, the same way STVElection.hold_election does
+    """
+    random.seed(0)
+    start = time.perf_counter()
+    election = engine(candidates, num_winners, ballots)
+    loaded = time.perf_counter()
+    rounds = []
+    while len(election.winners) < election.num_winners and len(election.remaining_candidates) > 0:
+        round_start = time.perf_counter()
+        election.count_votes()
+        rounds.append(time.perf_counter() - round_start)
+    end = time.perf_counter()
+    return {'engine': engine.__name__,
+            'load_seconds': loaded - start,
+            'count_seconds': end - loaded,
+            'total_seconds': end - start,
+            'round_seconds': rounds,
+            'winners': election.winners}
+
+
+def time_database(candidates, num_winners, ballots, path):
+    """
+    Stores an election in SQLite and times counting it with membership.web.elections.hold_election
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine('sqlite:///' + path)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        election_id = conn.execute(Election.__table__.insert(), name='Benchmark',
+                                   number_winners=num_winners).inserted_primary_key[0]
+        conn.execute(Member.__table__.insert(),
+                     [{'id': i + 1, 'first_name': str(c)} for i, c in enumerate(candidates)])
+        conn.execute(Candidate.__table__.insert(),
+                     [{'id': c + 1, 'member_id': c + 1, 'election_id': election_id}
+                      for c in candidates])
+        conn.execute(Vote.__table__.insert(),
+                     [{'id': i + 1, 'vote_key': i, 'election_id': election_id}
+                      for i in range(len(ballots))])
+        conn.execute(Ranking.__table__.insert(),
+                     [{'vote_id': i + 1, 'rank': rank, 'candidate_id': c + 1}
+                      for i, ballot in enumerate(ballots) for rank, c in enumerate(ballot)])
+
+    session = sessionmaker(bind=engine)()
+    try:
+        random.seed(0)
+        start = time.perf_counter()
+        election = session.query(Election).get(election_id)
+        stv = hold_election(election)
+        end = time.perf_counter()
+    finally:
+        session.close()
+        engine.dispose()
+        os.remove(path)
+    return {'engine': 'hold_election (sqlite)',
+            'total_seconds': end - start,
+            'winners': [cid - 1 for cid in stv.winners]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ballots', type=int, default=20000)
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--winners', type=int, default=5)
+    parser.add_argument('--ranking-lengths', choices=RANKING_LENGTHS, default='geometric')
+    parser.add_argument('--mean-length', type=float, default=3.0)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='count every election this many times and keep the fastest run')
+    parser.add_argument('--skip-database', action='store_true')
+    parser.add_argument('--database-path', default='stv_benchmark.sqlite')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    candidates, ballots = generate_election(args.ballots, args.candidates, args.ranking_lengths,
+                                            args.mean_length, args.skew, args.seed)
+    results = []
+    for engine in ENGINES:
+        runs = [time_engine(engine, candidates, args.winners, ballots) for _ in range(args.repeat)]
+        results.append(min(runs, key=lambda run: run['total_seconds']))
+    if not args.skip_database:
+        results.append(time_database(candidates, args.winners, ballots, args.database_path))
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'parameters': {'ballots': args.ballots,
+                       'candidates': args.candidates,
+                       'winners': args.winners,
+                       'ranking_lengths': args.ranking_lengths,
+                       'mean_length': args.mean_length,
+                       'skew': args.skew,
+                       'seed': args.seed},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Generates synthetic STV elections for benchmarking.
+"""
+import random
+from typing import List, Tuple
+
+RANKING_LENGTHS = ('full', 'uniform', 'geometric')
+
+
+def ranking_length(rng: random.Random, num_candidates: int, distribution: str,
+                   mean_length: float) -> int:
+    """
+    Draws how many candidates a ballot ranks
+    :param rng: the random generator to draw with
+    :param num_candidates: the number of candidates standing
+    :param distribution: 'full' ranks everyone, 'uniform' draws evenly from 1 to every candidate
+    and 'geometric' draws from a geometric distribution with the given mean
+    :param mean_length: the mean ranking length of the geometric distribution
+    :return: the ranking length
+    """
+    if distribution == 'full':
+        return num_candidates
+    if distribution == 'uniform':
+        return rng.randint(1, num_candidates)
+    if distribution == 'geometric':
+        length = 1
+        while length < num_candidates and rng.random() > 1 / mean_length:
+            length += 1
+        return length
+    raise ValueError('Unknown ranking length distribution {}'.format(distribution))
+
+
+def generate_election(num_ballots: int, num_candidates: int, distribution: str = 'geometric',
+                      mean_length: float = 3.0, skew: float = 1.0,
+                      seed: int = 0) -> Tuple[List[int], List[List[int]]]:
+    """
+    Generates the ballots of an election where some candidates are more popular than others
+    :param num_ballots: the number of ballots cast
+    :param num_candidates: the number of candidates standing
+    :param distribution: how ranking lengths are distributed, see ranking_length
+    :param mean_length: the mean ranking length of the geometric distribution
+    :param skew: candidate i is preferred with weight 1 / (i + 1) ** skew, 0 makes everyone
+    equally popular
+    :param seed: the seed of the random generator
+    :return: the candidates and the ranked choices of each ballot
+    """
+    rng = random.Random(seed)
+    candidates = list(range(num_candidates))
+    popularity = [1 / (i + 1) ** skew for i in candidates]
+    ballots = []
+    for _ in range(num_ballots):
+        length = ranking_length(rng, num_candidates, distribution, mean_length)
+        # Weighted sampling without replacement: sort by random keys scaled by popularity
+        keys = [(rng.random() ** (1 / weight), candidate)
+                for candidate, weight in zip(candidates, popularity)]
+        keys.sort(reverse=True)
+        ballots.append([candidate for _, candidate in keys[:length]])
+    return candidates, ballots
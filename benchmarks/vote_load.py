@@ -0,0 +1,172 @@
+"""
+Measures ballot submission throughput with many members voting at once.
+
+    python -m benchmarks.vote_load --voters 2000 --workers 32 --output results.json
+
+Each worker thread submits ballots through membership.web.elections.cast_vote with its own
+session, the way concurrent /vote requests do. With --duplicates every member submits twice at
+the same time, and the run checks that exactly one ballot per member was recorded. The tables are
+created in --database-url, which defaults to a scratch SQLite file. Point it at an empty MySQL
+database to measure row contention.
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from membership.database.base import metadata  # noqa: E402
+from membership.database.models import (  # noqa: E402
+    Candidate, Election, EligibleVoter, Member, Vote)
+from membership.web.elections import AlreadyVoted, cast_vote  # noqa: E402
+
+
+def create_election(engine, voters, candidates):
+    """
+    Stores an election with the given number of candidates and eligible voters
+    :return: the election id, the candidate ids and the voters' member ids
+    """
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        election_id = conn.execute(Election.__table__.insert(), name='Load test',
+                                   status='polls open', number_winners=1).inserted_primary_key[0]
+        conn.execute(Member.__table__.insert(),
+                     [{'first_name': 'Voter', 'last_name': str(i)}
+                      for i in range(voters + candidates)])
+        member_ids = [member_id for member_id, in conn.execute(
+            Member.__table__.select().with_only_columns([Member.id]).order_by(Member.id))]
+        conn.execute(Candidate.__table__.insert(),
+                     [{'member_id': member_id, 'election_id': election_id}
+                      for member_id in member_ids[voters:]])
+        candidate_ids = [candidate_id for candidate_id, in conn.execute(
+            Candidate.__table__.select().with_only_columns([Candidate.id]).where(
+                Candidate.election_id == election_id))]
+        conn.execute(EligibleVoter.__table__.insert(),
+                     [{'member_id': member_id, 'election_id': election_id, 'voted': False}
+                      for member_id in member_ids[:voters]])
+    return election_id, candidate_ids, member_ids[:voters]
+
+
+def run_load(engine, election_id, candidate_ids, member_ids, workers, duplicates, seed):
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(seed)
+    submissions = queue.Queue()
+    # Duplicate submissions sit next to each other in the queue so that two workers race on them
+    copies = 2 if duplicates else 1
+    for member_id in [member_id for member_id in member_ids for _ in range(copies)]:
+        ranking = rng.sample(candidate_ids, rng.randint(1, len(candidate_ids)))
+        submissions.put((member_id, ranking))
+    latencies = []
+    counts = {'accepted': 0, 'already_voted': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker():
+        session = Session()
+        try:
+            while True:
+                try:
+                    member_id, ranking = submissions.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                try:
+                    cast_vote(session, election_id, member_id, ranking)
+                    outcome = 'accepted'
+                except AlreadyVoted:
+                    outcome = 'already_voted'
+                except Exception:
+                    session.rollback()
+                    outcome = 'errors'
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    counts[outcome] += 1
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    session = Session()
+    try:
+        recorded = session.query(Vote).filter_by(election_id=election_id).count()
+    finally:
+        session.close()
+    latencies.sort()
+    return dict(counts,
+                seconds=elapsed,
+                ballots_per_second=counts['accepted'] / elapsed,
+                latency_p50=latencies[len(latencies) // 2],
+                latency_p95=latencies[int(len(latencies) * 0.95)],
+                latency_max=latencies[-1],
+                recorded_votes=recorded,
+                one_vote_per_member=recorded == counts['accepted'] == len(member_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--voters', type=int, default=2000)
+    parser.add_argument('--candidates', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--duplicates', action='store_true',
+                        help='submit every ballot twice at the same time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url',
+                        help='an empty database to create the tables in (default: a SQLite file)')
+    parser.add_argument('--database-path', default='vote_load.sqlite')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    scratch = args.database_url is None
+    if scratch:
+        if os.path.exists(args.database_path):
+            os.remove(args.database_path)
+        engine = create_engine('sqlite:///' + args.database_path,
+                               connect_args={'timeout': 60})
+    else:
+        engine = create_engine(args.database_url, pool_size=args.workers, max_overflow=0)
+    try:
+        election_id, candidate_ids, member_ids = create_election(engine, args.voters,
+                                                                 args.candidates)
+        results = run_load(engine, election_id, candidate_ids, member_ids, args.workers,
+                           args.duplicates, args.seed)
+    finally:
+        engine.dispose()
+        if scratch:
+            os.remove(args.database_path)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': engine.url.drivername,
+        'parameters': {'voters': args.voters,
+                       'candidates': args.candidates,
+                       'workers': args.workers,
+                       'duplicates': args.duplicates,
+                       'seed': args.seed},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Measures how much memory each STV engine holds per ballot once an election has been loaded.
+
+    python -m benchmarks.vote_memory --ballots 100000 --candidates 20 --ranking-lengths full
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.synthetic import RANKING_LENGTHS, generate_election
+from membership.util.vote import ArraySTVElection, GroupedSTVElection, IncrementalSTVElection, \
+    STVElection
+
+ENGINES = [STVElection, IncrementalSTVElection, GroupedSTVElection, ArraySTVElection]
+
+
+def measure(engine, candidates, ballots):
+    gc.collect()
+    tracemalloc.start()
+    election = engine(candidates, 1, ballots)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del election
+    return {'engine': engine.__name__,
+            'bytes_per_ballot': size / len(ballots),
+            'peak_bytes_per_ballot': peak / len(ballots)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ballots', type=int, default=100000)
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--ranking-lengths', choices=RANKING_LENGTHS, default='geometric')
+    parser.add_argument('--mean-length', type=float, default=3.0)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    candidates, ballots = generate_election(args.ballots, args.candidates, args.ranking_lengths,
+                                            args.mean_length, args.skew, args.seed)
+    results = [measure(engine, candidates, ballots) for engine in ENGINES]
+    print(json.dumps({'ballots': args.ballots, 'candidates': args.candidates,
+                      'ranking_lengths': args.ranking_lengths, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,3 +15,6 @@ AUTH_CONNECTION = os.environ.get('AUTH_CONNECTION', 'DSASF-Dev')
 ADMIN_CLIENT_ID = os.environ.get('ADMIN_CLIENT_ID', None)
 ADMIN_CLIENT_SECRET = os.environ.get('ADMIN_CLIENT_SECRET', None)
 
+# how many verified tokens to remember, and for how many seconds, before verifying them again
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
@@ -1,7 +1,27 @@
 import os
 
 DATABASE_URL = os.environ.get('DATABASE_URL', 'mysql://root@localhost:3306/dsa')
-settings = {'name_or_url': DATABASE_URL, 'pool_size': 10, 'pool_recycle': 3600}
+
+# connection pool sizing. Each worker holds its own pool, so the database sees up to
+# workers * (POOL_SIZE + POOL_MAX_OVERFLOW) connections.
+POOL_SIZE = int(os.environ.get('POOL_SIZE', 10))
+POOL_MAX_OVERFLOW = int(os.environ.get('POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.environ.get('POOL_RECYCLE', 3600))
+
+settings = {'name_or_url': DATABASE_URL, 'pool_size': POOL_SIZE, 'pool_recycle': POOL_RECYCLE}
+if not DATABASE_URL.startswith('sqlite'):
+    # sqlite keeps one connection per thread, so overflow and timeouts do not apply
+    settings.update(max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
 SUPER_USER_FIRST_NAME = os.environ.get('SUPER_USER_FIRST_NAME', 'Joe')
 SUPER_USER_LAST_NAME = os.environ.get('SUPER_USER_LAST_NAME', 'Schmoe')
 SUPER_USER_EMAIL = os.environ.get('SUPER_USER_EMAIL', 'joe.schmoe@example.com')
+
+# connections returned to the pool less than this many seconds ago are reused without a ping
+POOL_PING_INTERVAL = float(os.environ.get('POOL_PING_INTERVAL', 10))
+
+# checkouts that wait longer than this many seconds for a connection are logged
+POOL_WAIT_WARNING = float(os.environ.get('POOL_WAIT_WARNING', 1))
+
+# how often, in seconds, to log the pool statistics. 0 turns the summary off
+POOL_LOG_INTERVAL = float(os.environ.get('POOL_LOG_INTERVAL', 300))
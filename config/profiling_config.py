@@ -0,0 +1,10 @@
+import os
+
+# record the queries and latency of every request, and report them in headers and the logs
+PROFILE_QUERIES = os.environ.get('PROFILE_QUERIES', 'FALSE') == 'TRUE'
+
+# the most queries a request may run before it is logged as over budget. 0 means no budget
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0))
+
+# how many of the slowest statements of each request to log
+PROFILE_SLOWEST = int(os.environ.get('PROFILE_SLOWEST', 3))
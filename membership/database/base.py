@@ -1,23 +1,139 @@
 import json
+import logging
+import threading
+import time
 from datetime import datetime
 
 import sqlalchemy.types as types
 from sqlalchemy import create_engine, event
-from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.exc import DisconnectionError, TimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
-from config.database_config import settings
+from config.database_config import POOL_LOG_INTERVAL, POOL_PING_INTERVAL, POOL_WAIT_WARNING, \
+    settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """
+    Counts what the connection pool does, so that workers can be sized against it
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.invalidations = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+            self.max_checked_out = 0
+            self.max_overflow = 0
+            self.pings = 0
+            self.ping_time = 0.0
+            self.max_ping_time = 0.0
+            self.last_logged = time.time()
+
+    def record_wait(self, seconds: float, checked_out: int, overflow: int, timed_out: bool=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+            self.max_overflow = max(self.max_overflow, overflow)
+
+    def record_checkout(self):
+        with self.lock:
+            self.checkouts += 1
+
+    def record_ping(self, seconds: float):
+        with self.lock:
+            self.pings += 1
+            self.ping_time += seconds
+            self.max_ping_time = max(self.max_ping_time, seconds)
+
+    def record_invalidation(self):
+        with self.lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool=None) -> dict:
+        """
+        :param pool: the pool to report the current size and usage of, if it is a QueuePool
+        :return: the counters since the last reset, with times in seconds
+        """
+        with self.lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'invalidations': self.invalidations,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                'max_checked_out': self.max_checked_out,
+                'max_overflow': self.max_overflow,
+                'pings': self.pings,
+                'ping_time': self.ping_time,
+                'max_ping_time': self.max_ping_time,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(), overflow=pool.overflow(),
+                         timeout=pool.timeout())
+        return stats
+
+    def log_if_due(self, pool=None):
+        if POOL_LOG_INTERVAL <= 0 or time.time() - self.last_logged < POOL_LOG_INTERVAL:
+            return
+        self.last_logged = time.time()
+        logger.info('Connection pool: %s', self.snapshot(pool))
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A QueuePool that records how long each checkout waited for a connection
+    """
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            con_record = super(InstrumentedQueuePool, self)._do_get()
+        except TimeoutError:
+            pool_stats.record_wait(time.time() - start, self.checkedout(), self.overflow(),
+                                   timed_out=True)
+            logger.warning('Timed out waiting for a database connection: %s', self.status())
+            raise
+        waited = time.time() - start
+        pool_stats.record_wait(waited, self.checkedout(), self.overflow())
+        if waited >= POOL_WAIT_WARNING:
+            logger.warning('Waited %.3fs for a database connection: %s', waited, self.status())
+        return con_record
 
 
 def checkout_listener(dbapi_con, con_record, con_proxy):
     """
-    Ensures that connections in the pool are still valid before returning them
+    Ensures that connections in the pool are still valid before returning them. Connections that
+    were returned to the pool less than POOL_PING_INTERVAL seconds ago are trusted without a ping.
     :param dbapi_con:
     :param con_record:
     :param con_proxy:
     :return:
     """
+    pool_stats.record_checkout()
+    last_used = con_record.info.get('last_used')
+    if last_used is not None and time.time() - last_used < POOL_PING_INTERVAL:
+        return
+    if not hasattr(dbapi_con, 'ping'):  # sqlite connections cannot go away
+        return
+    start = time.time()
     try:
         try:
             dbapi_con.ping(False)
@@ -28,13 +144,51 @@ def checkout_listener(dbapi_con, con_record, con_proxy):
             raise DisconnectionError()
         else:
             raise
+    finally:
+        pool_stats.record_ping(time.time() - start)
+
+
+def checkin_listener(dbapi_con, con_record):
+    """
+    Records when a connection was last returned to the pool
+    :param dbapi_con:
+    :param con_record:
+    :return:
+    """
+    con_record.info['last_used'] = time.time()
+    pool_stats.log_if_due(engine.pool)
+
+
+def invalidate_listener(dbapi_con, con_record, exception):
+    """
+    Counts connections that were thrown away, such as those that failed their checkout ping
+    :param dbapi_con:
+    :param con_record:
+    :param exception:
+    :return:
+    """
+    pool_stats.record_invalidation()
+    logger.warning('Invalidated a database connection: %r', exception)
+
+
+def create_pool_engine(**kwargs):
+    """
+    Creates an engine with the pool listeners attached. Pools that can wait for a connection are
+    instrumented to record the wait.
+    """
+    if 'max_overflow' in kwargs:
+        kwargs.setdefault('poolclass', InstrumentedQueuePool)
+    pool_engine = create_engine(**kwargs)
+    event.listen(pool_engine, 'checkout', checkout_listener)
+    event.listen(pool_engine, 'checkin', checkin_listener)
+    event.listen(pool_engine, 'invalidate', invalidate_listener)
+    return pool_engine
 
 
 Base = declarative_base()
 metadata = Base.metadata
-engine = create_engine(**settings)
+engine = create_pool_engine(**settings)
 Session = sessionmaker(bind=engine)
-event.listen(engine, 'checkout', checkout_listener)
 
 
 def date_parser(date_str):
@@ -1,11 +1,11 @@
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import UniqueConstraint
 
-from membership.database.base import Base
+from membership.database.base import Base, JSON
 
 
 class Member(Base):
@@ -23,11 +23,15 @@ class Member(Base):
 
     @property
     def name(self) -> str:
+        return self.format_name(self.first_name, self.last_name)
+
+    @staticmethod
+    def format_name(first_name: str, last_name: str) -> str:
         n = ''
-        if self.first_name:
-            n = self.first_name
-        if self.last_name:
-            n += ' ' + self.last_name
+        if first_name:
+            n = first_name
+        if last_name:
+            n += ' ' + last_name
         return n
 
 
@@ -40,6 +44,7 @@ class Committee(Base):
 
 class Role(Base):
     __tablename__ = 'roles'
+    __table_args__ = (Index('ix_roles_member_committee_role', 'member_id', 'committee_id', 'role'),)
 
     id: int = Column(Integer, primary_key=True, unique=True)
     committee_id: int = Column(ForeignKey('committees.id'))
@@ -65,6 +70,8 @@ class Meeting(Base):
 
 class Attendee(Base):
     __tablename__ = 'attendees'
+    __table_args__ = (
+        UniqueConstraint('meeting_id', 'member_id', name='uq_attendees_meeting_member'),)
 
     id: int = Column(Integer, primary_key=True, unique=True)
     meeting_id: int = Column(ForeignKey('meetings.id'))
@@ -81,6 +88,8 @@ class Election(Base):
     name: str = Column(String(45), nullable=False)
     status: str = Column(String(45), nullable=False, default='draft')
     number_winners: int = Column(Integer)
+    # how many times entered rankings have been replaced, so that stored counts can tell
+    rankings_replaced: int = Column(Integer, nullable=False, default=0, server_default='0')
 
     candidates: List['Candidate'] = relationship('Candidate', back_populates='election')
     votes: List['Vote'] = relationship('Vote', back_populates='election')
@@ -112,6 +121,7 @@ class Vote(Base):
 
 class Ranking(Base):
     __tablename__ = 'rankings'
+    __table_args__ = (Index('ix_rankings_vote_rank', 'vote_id', 'rank', 'candidate_id'),)
 
     id: int = Column(Integer, primary_key=True, unique=True)
     vote_id: int = Column(ForeignKey('votes.id'))
@@ -124,6 +134,8 @@ class Ranking(Base):
 
 class EligibleVoter(Base):
     __tablename__ = 'eligible_voters'
+    __table_args__ = (
+        UniqueConstraint('election_id', 'member_id', name='uq_eligible_voters_election_member'),)
 
     id: int = Column(Integer, primary_key=True, unique=True)
     member_id: int = Column(ForeignKey('members.id'))
@@ -132,3 +144,15 @@ class EligibleVoter(Base):
 
     member: 'Member' = relationship('Member', back_populates='eligible_votes')
     election: 'Election' = relationship('Election', back_populates='voters')
+
+
+class ElectionResult(Base):
+    __tablename__ = 'election_results'
+
+    id: int = Column(Integer, primary_key=True, unique=True)
+    election_id: int = Column(ForeignKey('elections.id'), unique=True)
+    ballot_version: str = Column(String(255))
+    final: bool = Column(Boolean)
+    results: dict = Column(JSON)
+
+    election: 'Election' = relationship('Election')
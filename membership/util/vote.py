@@ -1,43 +1,132 @@
+import copy
+import csv
+import json
+import multiprocessing
 import random
-from decimal import Decimal, getcontext
-from typing import Dict, Generic, List, Set, TypeVar
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, FrozenSet, Generic, Iterable, Iterator, List, Optional, Sequence, Set, \
+    Tuple, TypeVar
 
-ZERO = Decimal('0.00000')
-ONE = Decimal('1.00000')
+import numpy as np
+
+# Ballot weights and tallies are fixed point integers counting hundred-thousandths of a vote, so
+# tallies are exact whatever order ballots are added up in.
+WEIGHT_PLACES = 5
+ZERO = 0
+ONE = 10 ** WEIGHT_PLACES
 
 T = TypeVar('T')
 
 
+def group_ballots(choices_list: Iterable[Sequence[T]]) -> List[Tuple[Tuple[T, ...], int]]:
+    """
+    Collapses identical rankings into (ranking, number of ballots) pairs
+    :param choices_list: the ranked choices of each ballot
+    :return: every distinct ranking with the number of ballots that cast it
+    """
+    return list(Counter(tuple(choices) for choices in choices_list).items())
+
+
+def scale_weight(weight: int, transfer_weight: int) -> int:
+    """
+    Multiplies two fixed point weights, rounding half to even like Decimal.quantize
+    """
+    quotient, remainder = divmod(weight * transfer_weight, ONE)
+    if remainder * 2 > ONE or (remainder * 2 == ONE and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+def divide_weight(numerator: int, denominator: int) -> int:
+    """
+    Divides two fixed point numbers into a fixed point weight, rounding half to even
+    """
+    quotient, remainder = divmod(numerator * ONE, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+def to_decimal(weight: int) -> Decimal:
+    """
+    Converts a fixed point weight or tally to a Decimal with five decimal places
+    """
+    return Decimal(weight).scaleb(-WEIGHT_PLACES)
+
+
+def read_json_ballots(lines: Iterable[str]) -> Iterator[List]:
+    """
+    Streams ballots from a JSON lines export with one list of ranked choices per line
+    """
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv_ballots(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Streams ballots from a CSV export with one row of ranked choices per ballot
+    """
+    for row in csv.reader(lines):
+        yield [choice for choice in row if choice]
+
+
 class Vote(Generic[T]):
-    def __init__(self, choices: List[T]):
-        self.weight: Decimal = ONE
-        self.choice_stack: List[T] = list(reversed(choices))
+    __slots__ = ('ranking', 'position', 'weight', 'count')
+
+    def __init__(self, ranking: Tuple[T, ...], count: int = 1):
+        # The ranking is never modified, so votes with the same ranking can share one tuple
+        self.ranking: Tuple[T, ...] = ranking
+        self.position: int = 0
+        self.weight: int = ONE
+        self.count: int = count
 
-    def transfer(self, transfer_weight: Decimal, remaining_candidates: Set[T]) -> None:
-        self.weight *= transfer_weight
-        self.choice_stack.pop()
-        while self.choice_stack and self.choice_stack[-1] not in remaining_candidates:
-            self.choice_stack.pop()
+    def transfer(self, transfer_weight: int, remaining_candidates: Set[T]) -> None:
+        self.weight = scale_weight(self.weight, transfer_weight)
+        self.position += 1
+        while self.position < len(self.ranking) and \
+                self.ranking[self.position] not in remaining_candidates:
+            self.position += 1
 
 
 class CandidateVotes(Generic[T]):
+    __slots__ = ('candidate', 'total', 'transfer_total', 'votes')
+
     def __init__(self, candidate: T):
         self.candidate: T = candidate
-        self.total: Decimal = ZERO
-        self.transfer_total: Decimal = ZERO
+        self.total: int = ZERO
+        self.transfer_total: int = ZERO
         self.votes: List[Vote[T]] = []
 
 
 class STVElection(Generic[T]):
-    def __init__(self, candidates: List[T], num_winners: int, choices_list: List[List[T]]):
-        self.votes: List[Vote[T]] = [Vote(choices) for choices in choices_list]
+    def __init__(self, candidates: List[T], num_winners: int, choices_list: Iterable[Sequence[T]],
+                 rng: Optional[random.Random] = None):
+        # Ties that earlier rounds cannot break are drawn with rng, or the global random module
+        self.rng = rng or random
+        self.random_tie_breaks: int = 0
         self.winners: List[T] = []
         self.remaining_candidates: Set[T] = set(candidates)
         self.num_winners: int = num_winners
         self.previous_rounds: List[Dict[CandidateVotes[T], dict]] = []
 
-        self.quota = int(len(self.votes) / (self.num_winners + 1)) + 1
-        getcontext().prec = 5
+        self.num_ballots: int = self.load_ballots(candidates, choices_list)
+        self.quota = int(self.num_ballots / (self.num_winners + 1)) + 1
+
+    def load_ballots(self, candidates: List[T], choices_list: Iterable[Sequence[T]]) -> int:
+        """
+        Stores the ballots for counting
+        :param candidates: every candidate standing in the election
+        :param choices_list: the ranked choices of each ballot
+        :return: the number of ballots cast
+        """
+        rankings: Dict[Tuple[T, ...], Tuple[T, ...]] = {}
+        self.votes: List[Vote[T]] = []
+        for choices in choices_list:
+            ranking = tuple(choices)
+            self.votes.append(Vote(rankings.setdefault(ranking, ranking)))
+        return len(self.votes)
 
     def hold_election(self) -> List[T]:
         while len(self.winners) < self.num_winners and len(self.remaining_candidates) > 0:
@@ -45,25 +134,19 @@ class STVElection(Generic[T]):
         return self.winners
 
     def count_votes(self) -> None:
-        candidate_votes: Dict[T, CandidateVotes[T]] = {candidate: CandidateVotes(candidate) for candidate in self.remaining_candidates}
-        for vote in self.votes:  # type: Vote[T]
-            if len(vote.choice_stack) > 0 and vote.weight > ZERO:
-                cv = candidate_votes[vote.choice_stack[-1]]
-                cv.total += vote.weight
-                # If this is a transfer vote, record it as such
-                if vote.weight < ONE:
-                    cv.transfer_total += vote.weight
-                cv.votes.append(vote)
+        candidate_votes = self.tally_votes()
         self.previous_rounds.append(
             {
-                cv.candidate: {'total_votes': cv.total, 'total_transfer_votes': cv.transfer_total}
+                cv.candidate: {'total_votes': to_decimal(cv.total),
+                               'total_transfer_votes': to_decimal(cv.transfer_total)}
                 for cv in candidate_votes.values()
             }
         )
 
         result = list(candidate_votes.values())
         result.sort(key=lambda x: x.total, reverse=True)
-        if result[0].total >= self.quota or len(self.remaining_candidates) <= self.num_winners - len(self.winners):
+        quota = self.quota * ONE
+        if result[0].total >= quota or len(self.remaining_candidates) <= self.num_winners - len(self.winners):
             i = 0
             round_winners = []
             while i < len(result) and result[i].total == result[0].total:
@@ -72,12 +155,11 @@ class STVElection(Generic[T]):
             winner = self.break_tie(round_winners, len(self.previous_rounds) - 1, True)
             self.winners.append(winner.candidate)
             self.remaining_candidates.remove(winner.candidate)
-            if winner.total > self.quota:
-                transfer_weight = Decimal((winner.total - self.quota) / winner.total).quantize(ZERO)
+            if winner.total > quota:
+                transfer_weight = divide_weight(winner.total - quota, winner.total)
             else:
                 transfer_weight = ZERO
-            for vote in winner.votes:
-                vote.transfer(transfer_weight, self.remaining_candidates)
+            self.transfer_votes(winner, transfer_weight)
         else:
             i = len(result) - 1
             round_losers = []
@@ -86,22 +168,259 @@ class STVElection(Generic[T]):
                 i -= 1
             loser = self.break_tie(round_losers, len(self.previous_rounds) - 1, False)
             self.remaining_candidates.remove(loser.candidate)
-            for vote in loser.votes:
-                vote.transfer(ONE, self.remaining_candidates)
+            self.transfer_votes(loser, ONE)
+
+    def tally_votes(self) -> Dict[T, CandidateVotes[T]]:
+        candidate_votes: Dict[T, CandidateVotes[T]] = {candidate: CandidateVotes(candidate) for candidate in self.remaining_candidates}
+        for vote in self.votes:  # type: Vote[T]
+            if vote.position < len(vote.ranking) and vote.weight > ZERO:
+                cv = candidate_votes[vote.ranking[vote.position]]
+                weight = vote.weight * vote.count
+                cv.total += weight
+                # If this is a transfer vote, record it as such
+                if vote.weight < ONE:
+                    cv.transfer_total += weight
+                cv.votes.append(vote)
+        return candidate_votes
+
+    def transfer_votes(self, candidate_votes: CandidateVotes[T], transfer_weight: int) -> None:
+        """
+        Moves the ballots counted for an elected or eliminated candidate to their next choice
+        :param candidate_votes: the tally of the candidate leaving the count
+        :param transfer_weight: the fraction of each ballot's weight that carries over
+        """
+        for vote in candidate_votes.votes:
+            vote.transfer(transfer_weight, self.remaining_candidates)
 
     def break_tie(self, round_winners: List[CandidateVotes[T]], voting_round: int, win: bool) -> CandidateVotes[T]:
-        multiplier = 1 if win else -1
         if len(round_winners) == 1:
             return round_winners[0]
         if voting_round == 0:
-            return random.choice(round_winners)
+            self.random_tie_breaks += 1
+            return self.rng.choice(round_winners)
         max_vote = None
         next_round_winners = []
         for winner in round_winners:
-            total = multiplier * self.previous_rounds[voting_round - 1][winner.candidate]['total_votes']
+            total = self.previous_rounds[voting_round - 1][winner.candidate]['total_votes']
+            if not win:
+                total = -total
             if max_vote is None or total > max_vote:
                 next_round_winners = [winner]
                 max_vote = total
             elif total == max_vote:
                 next_round_winners.append(winner)
         return self.break_tie(next_round_winners, voting_round - 1, win)
+
+
+class ArraySTVElection(STVElection[T]):
+    """
+    Counts the same election as STVElection, but keeps the ballots in arrays instead of one Vote
+    object per ballot. Identical ballots are grouped, and each group is a row of candidate indexes
+    with a cursor pointing at its current choice, so every round is tallied with a handful of
+    batched array operations.
+
+    Weights are rounded the same way as in STVElection, so the totals, round history and
+    tie-breaks match it exactly.
+    """
+
+    def load_ballots(self, candidates: List[T], choices_list: Iterable[Sequence[T]]) -> int:
+        self.candidates: List[T] = list(candidates)
+        self.candidate_index: Dict[T, int] = {c: i for i, c in enumerate(self.candidates)}
+        groups = group_ballots(choices_list)
+        num_groups = len(groups)
+        self.counts = np.fromiter((count for _, count in groups), dtype=np.int64, count=num_groups)
+        self.lengths = np.fromiter((len(ranking) for ranking, _ in groups), dtype=np.int32,
+                                   count=num_groups)
+        width = int(self.lengths.max()) if num_groups else 0
+        flat = np.fromiter((self.index_candidate(c) for ranking, _ in groups for c in ranking),
+                           dtype=np.int32, count=int(self.lengths.sum()))
+
+        # Row i holds the indexes of group i's choices, padded with -1
+        self.rankings = np.full((num_groups, max(width, 1)), -1, dtype=np.int32)
+        self.rankings[np.arange(self.rankings.shape[1]) < self.lengths[:, None]] = flat
+        self.standing: List[T] = list(candidates)
+        self.start_count()
+        return int(self.counts.sum())
+
+    def start_count(self) -> None:
+        """
+        Resets the count to its first round. The ballot arrays are only ever read, so they are
+        left alone.
+        """
+        self.winners = []
+        self.remaining_candidates = set(self.standing)
+        self.previous_rounds = []
+        self.random_tie_breaks = 0
+        num_groups = len(self.counts)
+        self.cursors = np.zeros(num_groups, dtype=np.int32)
+        self.weights = np.full(num_groups, ONE, dtype=np.int64)
+        # Groups that still count towards someone
+        self.live = self.lengths > 0
+        self.remaining_mask = np.zeros(len(self.candidates), dtype=bool)
+        self.remaining_mask[[self.candidate_index[c] for c in self.remaining_candidates]] = True
+        self.round_ballots: Dict[T, np.ndarray] = {}
+
+    def recount(self, rng: Optional[random.Random] = None) -> 'ArraySTVElection[T]':
+        """
+        Counts the election again from scratch, sharing this election's ballot arrays
+        :param rng: draws the ties earlier rounds cannot break
+        :return: the new count
+        """
+        election = copy.copy(self)
+        election.rng = rng or random
+        election.start_count()
+        election.hold_election()
+        return election
+
+    def index_candidate(self, candidate: T) -> int:
+        if candidate not in self.candidate_index:
+            self.candidate_index[candidate] = len(self.candidates)
+            self.candidates.append(candidate)
+        return self.candidate_index[candidate]
+
+    def tally_votes(self) -> Dict[T, CandidateVotes[T]]:
+        ballots = np.flatnonzero(self.live)
+        tops = self.rankings[ballots, self.cursors[ballots]]
+        order = np.argsort(tops)
+        ballots = ballots[order]
+        bounds = np.searchsorted(tops[order], np.arange(len(self.candidates) + 1))
+        # Running sums over the sorted groups give every candidate's totals by subtraction
+        weights = self.weights[ballots] * self.counts[ballots]
+        totals = np.concatenate(([0], np.cumsum(weights)))
+        transfer_totals = np.concatenate(([0], np.cumsum(weights * (self.weights[ballots] < ONE))))
+
+        candidate_votes: Dict[T, CandidateVotes[T]] = {}
+        self.round_ballots = {}
+        for candidate in self.remaining_candidates:
+            index = self.candidate_index[candidate]
+            start, end = bounds[index], bounds[index + 1]
+            pile = ballots[start:end]
+            cv = CandidateVotes(candidate)
+            cv.total = int(totals[end] - totals[start])
+            cv.transfer_total = int(transfer_totals[end] - transfer_totals[start])
+            candidate_votes[candidate] = cv
+            self.round_ballots[candidate] = pile
+        return candidate_votes
+
+    def transfer_votes(self, candidate_votes: CandidateVotes[T], transfer_weight: int) -> None:
+        self.remaining_mask[self.candidate_index[candidate_votes.candidate]] = False
+        pile = self.round_ballots[candidate_votes.candidate]
+        if len(pile) == 0:
+            return
+        if transfer_weight != ONE:
+            quotient, remainder = np.divmod(self.weights[pile] * transfer_weight, ONE)
+            # Round half to even, as scale_weight does
+            quotient += (remainder * 2 > ONE) | ((remainder * 2 == ONE) & (quotient % 2 == 1))
+            self.weights[pile] = quotient
+            self.live[pile] &= quotient > ZERO
+
+        pending = pile[self.live[pile]]
+        while len(pending) > 0:
+            self.cursors[pending] += 1
+            positions = self.cursors[pending]
+            has_choice = positions < self.lengths[pending]
+            self.live[pending[~has_choice]] = False
+            pending = pending[has_choice]
+            stale = ~self.remaining_mask[self.rankings[pending, positions[has_choice]]]
+            pending = pending[stale]
+
+
+class IncrementalSTVElection(STVElection[T]):
+    """
+    Counts the same election as STVElection, but keeps each candidate's pile of ballots between
+    rounds. Only the ballots of the candidate leaving the count are moved, and their weights are
+    added to the totals of the piles they land on, instead of recounting every ballot each round.
+    """
+
+    def load_ballots(self, candidates: List[T], choices_list: Iterable[Sequence[T]]) -> int:
+        num_ballots = super().load_ballots(candidates, choices_list)
+        self.build_piles()
+        return num_ballots
+
+    def build_piles(self) -> None:
+        self.piles: Dict[T, CandidateVotes[T]] = {
+            candidate: CandidateVotes(candidate) for candidate in self.remaining_candidates}
+        for vote in self.votes:
+            self.add_to_pile(vote)
+
+    def add_to_pile(self, vote: Vote[T]) -> None:
+        if vote.position < len(vote.ranking) and vote.weight > ZERO:
+            cv = self.piles[vote.ranking[vote.position]]
+            weight = vote.weight * vote.count
+            cv.total += weight
+            # If this is a transfer vote, record it as such
+            if vote.weight < ONE:
+                cv.transfer_total += weight
+            cv.votes.append(vote)
+
+    def tally_votes(self) -> Dict[T, CandidateVotes[T]]:
+        return {candidate: self.piles[candidate] for candidate in self.remaining_candidates}
+
+    def transfer_votes(self, candidate_votes: CandidateVotes[T], transfer_weight: int) -> None:
+        del self.piles[candidate_votes.candidate]
+        for vote in candidate_votes.votes:
+            vote.transfer(transfer_weight, self.remaining_candidates)
+            self.add_to_pile(vote)
+
+
+class GroupedSTVElection(IncrementalSTVElection[T]):
+    """
+    Counts the same election as IncrementalSTVElection, but with one Vote per distinct ranking
+    carrying the number of ballots that cast it. Ballots with the same ranking always move
+    together, so tallies and transfers run once per group instead of once per ballot.
+    """
+
+    def load_ballots(self, candidates: List[T], choices_list: Iterable[Sequence[T]]) -> int:
+        groups = group_ballots(choices_list)
+        self.votes: List[Vote[T]] = [Vote(ranking, count) for ranking, count in groups]
+        self.build_piles()
+        return sum(count for _, count in groups)
+
+
+# The election analyze_tie_breaks is sampling. Worker processes are forked after it is set, so
+# they share its ballot arrays with the parent instead of receiving a copy.
+_sampled_election: Optional[ArraySTVElection] = None
+
+
+def _count_seeds(seeds: Sequence[int]) -> Counter:
+    outcomes: Counter = Counter()
+    for seed in seeds:
+        outcomes[frozenset(_sampled_election.recount(random.Random(seed)).winners)] += 1
+    return outcomes
+
+
+def analyze_tie_breaks(candidates: List[T], num_winners: int, choices_list: Iterable[Sequence[T]],
+                       runs: int = 1000, seed: int = 0,
+                       processes: Optional[int] = None) -> Dict[FrozenSet[T], int]:
+    """
+    Counts an election under many random seeds to show how much its outcome depends on the ties
+    that can only be broken at random. Run i uses random.Random(seed + i), so an analysis is
+    reproducible whatever the number of processes.
+    :param candidates: every candidate standing in the election
+    :param num_winners: the number of seats
+    :param choices_list: the ranked choices of each ballot
+    :param runs: the number of seeds to count with
+    :param seed: the first seed
+    :param processes: the number of worker processes, defaults to one per core
+    :return: how many runs elected each set of winners
+    """
+    global _sampled_election
+    election = ArraySTVElection(candidates, num_winners, choices_list)
+    first = election.recount(random.Random(seed))
+    if first.random_tie_breaks == 0:
+        # No tie was drawn at random, so every seed elects the same winners
+        return {frozenset(first.winners): runs}
+
+    seeds = list(range(seed, seed + runs))
+    processes = processes or multiprocessing.cpu_count()
+    _sampled_election = election
+    try:
+        if processes == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            outcomes = _count_seeds(seeds)
+        else:
+            chunks = [seeds[i::processes * 4] for i in range(processes * 4)]
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                outcomes = sum(pool.map(_count_seeds, chunks), Counter())
+    finally:
+        _sampled_election = None
+    return dict(outcomes)
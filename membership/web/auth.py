@@ -1,17 +1,22 @@
 from config.auth_config import JWT_SECRET, JWT_CLIENT_ID, ADMIN_CLIENT_ID, ADMIN_CLIENT_SECRET, \
-    AUTH_CONNECTION, AUTH_URL, USE_AUTH, NO_AUTH_EMAIL
+    AUTH_CONNECTION, AUTH_URL, USE_AUTH, NO_AUTH_EMAIL, AUTH_CACHE_SIZE, AUTH_CACHE_TTL
 from config.portal_config import PORTAL_URL
+from collections import namedtuple, OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, Response, jsonify
+from flask import _app_ctx_stack, g, request, Response, jsonify
 import jwt
 import logging
 from membership.database.base import Session
-from membership.database.models import Member
+from membership.database.models import Member, Role
 import pkg_resources
 import random
 import requests
+from sqlalchemy.orm import make_transient_to_detached, scoped_session
 import string
+import threading
+import time
+from typing import FrozenSet, Optional, Tuple
 
 PASSWORD_CHARS = string.ascii_letters + string.digits
 
@@ -27,6 +32,91 @@ def deny(reason: str= '') -> Response:
     return response
 
 
+# A member's roles as (committee id, role) pairs, where a committee id of None is chapter-wide
+Permissions = FrozenSet[Tuple[Optional[int], str]]
+GLOBAL_ADMIN = (None, 'admin')
+
+
+class AuthEntry(namedtuple('AuthEntry', ['claims', 'member_id', 'permissions', 'expires'])):
+    @property
+    def is_admin(self) -> bool:
+        return GLOBAL_ADMIN in self.permissions
+
+
+class AuthCache:
+    """ A bounded, least recently used cache of verified tokens, so that repeat requests skip
+    verifying the token and looking up who sent it. Entries are dropped after ttl seconds or when
+    the token expires, whichever comes first.
+    """
+
+    def __init__(self, max_size: int, ttl: int) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # type: OrderedDict
+        self.lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[AuthEntry]:
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            if entry.expires <= time.time():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return entry
+
+    def put(self, token: str, claims: dict, member_id: int, permissions: Permissions) -> AuthEntry:
+        expires = time.time() + self.ttl
+        if 'exp' in claims:
+            expires = min(expires, claims['exp'])
+        entry = AuthEntry(claims, member_id, permissions, expires)
+        if self.max_size > 0:
+            with self.lock:
+                self.entries[token] = entry
+                self.entries.move_to_end(token)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def invalidate_member(self, member_id: int) -> None:
+        """ Forgets every token of a member, e.g. after their roles change. Only this process's
+        cache is cleared, other workers catch up within ttl seconds.
+        """
+        with self.lock:
+            for token in [t for t, e in self.entries.items() if e.member_id == member_id]:
+                del self.entries[token]
+
+
+auth_cache = AuthCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+# The session handed to route functions, scoped to the app context the way Flask-SQLAlchemy scopes
+# its session. It only checks a connection out of the pool when it is first used, and the
+# blueprints register close_request_session to close it when each request ends.
+request_session = scoped_session(
+    Session, scopefunc=getattr(_app_ctx_stack, '__ident_func__', None) or threading.get_ident)
+
+
+def close_request_session(exception=None) -> None:
+    request_session.remove()
+
+
+def cached_member(session: Session, member_id: int) -> Member:
+    """ Attaches a member to the session without loading it. Reading anything but its id loads
+    the rest of the member on first access.
+    """
+    member = Member(id=member_id)
+    make_transient_to_detached(member)
+    session.add(member)
+    return member
+
+
+def get_permissions(session: Session, member_id: int) -> Permissions:
+    """ Loads every role a member holds with a single query on roles """
+    roles = session.query(Role.committee_id, Role.role).filter(Role.member_id == member_id)
+    return frozenset((committee_id, role) for committee_id, role in roles)
+
+
 def requires_auth(admin=False):
     """ This defines a decorator which when added to a route function in flask requires authorization to
     view the route.
@@ -39,30 +129,32 @@ def requires_auth(admin=False):
                 if not auth:
                     return deny('Authorization not found.')
                 token = auth.split()[1]
+            else:
+                token = NO_AUTH_EMAIL
+            entry = auth_cache.get(token)
+            if entry:
+                claims = entry.claims
+            elif USE_AUTH:
                 try:
-                    token = jwt.decode(token, JWT_SECRET, audience=JWT_CLIENT_ID)
+                    claims = jwt.decode(token, JWT_SECRET, audience=JWT_CLIENT_ID)
                 except Exception as e:
                     return deny(str(e))
-                email = token.get('email')
             else:
-                email = NO_AUTH_EMAIL
-            session = Session()
-            try:
-                member = session.query(Member).filter_by(email_address=email).one()
-                authenticated = False
-                if admin:
-                    for role in member.roles:
-                        if role.committee_id is None and role.role == 'admin':
-                            authenticated = True
-                else:
-                    authenticated = True
-                if authenticated:
-                    kwargs['requester'] = member
-                    kwargs['session'] = session
-                    return f(*args, **kwargs)
+                claims = {'email': NO_AUTH_EMAIL}
+            session = request_session
+            if entry:
+                member = cached_member(session, entry.member_id)
+            else:
+                member = session.query(Member).filter_by(email_address=claims.get('email')).one()
+                entry = auth_cache.put(token, claims, member.id,
+                                       get_permissions(session, member.id))
+            if admin and not entry.is_admin:
                 return deny('not enough access')
-            finally:
-                session.close()
+            # Handlers can check roles without loading member.roles again
+            g.permissions = entry.permissions
+            kwargs['requester'] = member
+            kwargs['session'] = session
+            return f(*args, **kwargs)
 
         return decorated
     return decorator
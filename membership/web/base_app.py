@@ -1,8 +1,11 @@
+from config.profiling_config import PROFILE_QUERIES, PROFILE_SLOWEST, QUERY_BUDGET
 from flask import jsonify
 from flask import Flask
 from flask_cors import CORS
+from membership.database import base
 from membership.web.members import member_api
 from membership.web.elections import election_api
+from membership.web.profiling import init_profiling
 from raven.contrib.flask import Sentry
 
 app = Flask(__name__)
@@ -10,8 +13,15 @@ CORS(app)
 app.register_blueprint(member_api)
 app.register_blueprint(election_api)
 sentry = Sentry(app)
+if PROFILE_QUERIES:
+    init_profiling(app, base.engine, budget=QUERY_BUDGET, slowest=PROFILE_SLOWEST)
 
 
 @app.route('/health', methods=["GET"])
 def health_check():
-    return jsonify({'health': True})
\ No newline at end of file
+    return jsonify({'health': True})
+
+
+@app.route('/health/pool', methods=["GET"])
+def pool_health():
+    return jsonify(base.pool_stats.snapshot(base.engine.pool))
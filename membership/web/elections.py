@@ -1,15 +1,22 @@
 from flask import Blueprint, jsonify, request, Response
 from membership.database.base import Session
-from membership.database.models import Candidate, Election, Member, EligibleVoter, Vote, Ranking
-from membership.web.auth import requires_auth
+from membership.database.models import Attendee, Candidate, Election, ElectionResult, Meeting, \
+    Member, EligibleVoter, Vote, Ranking
+from membership.web.auth import close_request_session, requires_auth
 from membership.web.util import BadRequest
-from membership.util.vote import STVElection
-from membership.web.util import CustomEncoder, custom_jsonify
+from membership.util.vote import ArraySTVElection
+from membership.web.util import CustomEncoder, custom_jsonify, STREAM_CHUNK_SIZE, stream_json
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 import random
+from sqlalchemy import and_, exists, false, func, literal, or_, select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import object_session
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 election_api = Blueprint('election_api', __name__)
+election_api.teardown_app_request(close_request_session)
 
 
 @election_api.route('/election/list', methods=['GET'])
@@ -52,13 +59,14 @@ def add_election(requester: Member, session: Session):
 @requires_auth(admin=True)
 def get_eligible(requester: Member, session: Session):
     election_id = request.args['election_id']
-    eligibles = session.query(EligibleVoter)\
-        .filter_by(election_id=election_id).options(joinedload(EligibleVoter.member)).all()
-    results = {}
-    for eligible in eligibles:
-        results[eligible.member_id] = {'name': eligible.member.name,
-                                       'email_address': eligible.member.email_address}
-    return jsonify(results)
+    eligibles = session.query(EligibleVoter.member_id, Member.first_name, Member.last_name,
+                              Member.email_address). \
+        join(Member, EligibleVoter.member_id == Member.id). \
+        filter(EligibleVoter.election_id == election_id). \
+        order_by(EligibleVoter.member_id)
+    return stream_json(eligibles.yield_per(STREAM_CHUNK_SIZE), lambda row: (
+        row.member_id, {'name': Member.format_name(row.first_name, row.last_name),
+                        'email_address': row.email_address}), keyed=True)
 
 
 @election_api.route('/election/<int:election_id>/vote/<int:ballot_key>', methods=['GET'])
@@ -98,10 +106,10 @@ def issue_ballot(requester: Member, session: Session):
 def add_paper_ballots(requester: Member, session: Session):
     election_id = request.json['election_id']
     number_ballots = request.json['number_ballots']
-    ballot_keys = []
-    for i in range(0, number_ballots):
-        vote, _ = create_vote(session, election_id, 5)
-        ballot_keys.append(vote.vote_key)
+    try:
+        ballot_keys = create_votes(session, election_id, 5, number_ballots)
+    except ValueError as e:
+        return BadRequest(str(e))
     return jsonify(ballot_keys)
 
 
@@ -112,30 +120,89 @@ def submit_paper_vote(requester: Member, session: Session):
     election = session.query(Election).get(election_id)
     if election.status == 'final':
         return BadRequest('You may not submit more votes after an election has been marked final')
-    vote_key = request.json['ballot_key']
-    vote = session.query(Vote).filter_by(
-        election_id=election_id,
-        vote_key=vote_key).with_for_update().one_or_none()
-
-    if not vote:
+    try:
+        vote_key = int(request.json['ballot_key'])
+    except (KeyError, TypeError, ValueError):
+        return BadRequest('The ballot needs an integer ballot_key.')
+    status, = reconcile_paper_ballots(session, election_id,
+                                      [(vote_key, request.json['rankings'])],
+                                      request.json.get('override', False))
+    if status == 'not claimed':
         return Response('Ballot #{} for election_id={} not claimed'.format(vote_key, election_id), 404)
+    return jsonify({'status': status})
 
-    if vote.ranking and not request.json.get('override', False):
-        if len(vote.ranking) != len(request.json['rankings']):
-            return jsonify({'status': 'mismatch'})
-        for rank, candidate_id in enumerate(request.json['rankings']):
-            if candidate_id != vote.ranking[rank].candidate_id:
-                return jsonify({'status': 'mismatch'})
-        return jsonify({'status': 'match'})
-    if request.json.get('override', False):
-        for rank in vote.ranking:
-            session.delete(rank)
-    for rank, candidate_id in enumerate(request.json['rankings']):
-        ranking = Ranking(rank=rank, candidate_id=candidate_id)
-        vote.ranking.append(ranking)
-    session.add(vote)
+
+@election_api.route('/vote/paper/batch', methods=['POST'])
+@requires_auth(admin=True)
+def submit_paper_votes(requester: Member, session: Session):
+    """
+    Enters or checks a whole box of paper ballots at once. Takes a list of ballots, each with a
+    ballot_key and rankings, and returns the status of each in the same order.
+    """
+    election_id = request.json['election_id']
+    election = session.query(Election).get(election_id)
+    if election.status == 'final':
+        return BadRequest('You may not submit more votes after an election has been marked final')
+    try:
+        ballots = [(ballot['ballot_key'], ballot['rankings']) for ballot in request.json['ballots']]
+        statuses = reconcile_paper_ballots(session, election_id, ballots,
+                                           request.json.get('override', False))
+    except (KeyError, TypeError, ValueError):
+        return BadRequest('Each ballot needs an integer ballot_key and rankings.')
+    return jsonify({'ballots': [{'ballot_key': ballot_key, 'status': status}
+                                for (ballot_key, _), status in zip(ballots, statuses)]})
+
+
+def reconcile_paper_ballots(session: Session, election_id: int,
+                            ballots: List[Tuple[int, List[int]]],
+                            override: bool=False) -> List[str]:
+    """
+    Compares paper ballots with what was entered for them before, and stores the rankings of those
+    entered for the first time. The claimed votes and their rankings are loaded and locked with one
+    query, and every new ranking is written with one insert.
+    :param session: the session to enter the ballots with. It is committed
+    :param election_id: the election the ballots are for
+    :param ballots: the key and ranked candidate ids of each ballot
+    :param override: replace the entered rankings instead of comparing with them
+    :return: for each ballot, 'new' if its rankings were stored, 'match' or 'mismatch' if they were
+        compared with the entered ones, or 'not claimed' if there is no such ballot
+    """
+    ballots = [(int(vote_key), rankings) for vote_key, rankings in ballots]
+    keys = {vote_key for vote_key, _ in ballots}
+    rows: Iterable[Tuple[int, int, Optional[int]]] = []
+    if keys:
+        rows = session.query(Vote.vote_key, Vote.id, Ranking.candidate_id). \
+            outerjoin(Ranking, Ranking.vote_id == Vote.id). \
+            filter(Vote.election_id == election_id, Vote.vote_key.in_(keys)). \
+            order_by(Vote.id, Ranking.rank).with_for_update()
+    vote_ids = {}  # type: Dict[int, int]
+    entered = {}  # type: Dict[int, List[int]]
+    for vote_key, vote_id, candidate_id in rows:
+        vote_ids[vote_key] = vote_id
+        entered.setdefault(vote_key, [])
+        if candidate_id is not None:
+            entered[vote_key].append(candidate_id)
+
+    statuses = []
+    new_rankings = {}  # type: Dict[int, List[int]]
+    for vote_key, rankings in ballots:
+        if vote_key not in vote_ids:
+            statuses.append('not claimed')
+        elif entered[vote_key] and not override:
+            statuses.append('match' if entered[vote_key] == rankings else 'mismatch')
+        else:
+            entered[vote_key] = new_rankings[vote_ids[vote_key]] = rankings
+            statuses.append('new')
+    if override and new_rankings:
+        session.query(Ranking).filter(Ranking.vote_id.in_(new_rankings)). \
+            delete(synchronize_session=False)
+        # The new rankings may reuse the deleted ids, so mark the ballots as changed another way
+        session.query(Election).filter(Election.id == election_id). \
+            update({Election.rankings_replaced: Election.rankings_replaced + 1},
+                   synchronize_session=False)
+    insert_rankings(session, new_rankings)
     session.commit()
-    return jsonify({'status': 'new'})
+    return statuses
 
 
 @election_api.route('/vote', methods=['POST'])
@@ -145,29 +212,92 @@ def submit_vote(requester: Member, session: Session):
     election = session.query(Election).get(election_id)
     if election.status == 'final' or election.status == 'polls closed':
         return BadRequest('You may not submit a vote after the polls have closed')
-    eligible = session.query(EligibleVoter). \
-        filter_by(member_id=requester.id, election_id=election_id).with_for_update().one_or_none()
-    if not eligible:
+    try:
+        vote_key = cast_vote(session, election_id, requester.id, request.json['rankings'])
+    except NotEligible:
         return BadRequest('You are not eligible for this election.')
-    if eligible.voted:
+    except AlreadyVoted:
         return BadRequest('You have either already voted or received a paper ballot for this '
                           'election.')
-    eligible.voted = True
-    vote, rolled_back = create_vote(session, election_id, 6)
-    if rolled_back:  # If we lost the lock we have to recheck
-        eligible = session.query(EligibleVoter). \
-            filter_by(member_id=requester.id,
-                      election_id=election_id).with_for_update().one_or_none()
-        if eligible.voted:
-            return BadRequest('You have either already voted or received a paper ballot for this '
-                              'election.')
-        eligible.voted = True
-    for rank, candidate_id in enumerate(request.json['rankings']):
-        ranking = Ranking(rank=rank, candidate_id=candidate_id)
-        vote.ranking.append(ranking)
-    session.add(vote)
-    session.commit()
-    return jsonify({'ballot_id': vote.vote_key})
+    except InvalidBallot:
+        return BadRequest('Your ballot ranks candidates that are not running in this election, or '
+                          'ranks a candidate more than once.')
+    return jsonify({'ballot_id': vote_key})
+
+
+class NotEligible(Exception):
+    pass
+
+
+class InvalidBallot(Exception):
+    pass
+
+
+class AlreadyVoted(Exception):
+    pass
+
+
+def cast_vote(session: Session, election_id: int, member_id: int, rankings: List[int],
+              digits: int=6) -> int:
+    """
+    Records a member's ballot in one transaction without locking rows. Marking the member as voted
+    is a conditional UPDATE, so only one of several concurrent submissions can succeed. The vote
+    and its rankings are then inserted with one statement each. If the random key is already
+    taken the whole transaction is retried with a new key. The rankings are checked against the
+    election's candidates first, so a bad ballot is never mistaken for a key collision.
+    :param session: the session to record the ballot with
+    :param election_id: the election being voted in
+    :param member_id: the member voting
+    :param rankings: the ranked candidate ids
+    :param digits: how many digits the ballot key has
+    :return: the new ballot key
+    :raises NotEligible: if the member is not eligible to vote in the election
+    :raises AlreadyVoted: if the member has voted or received a paper ballot
+    :raises InvalidBallot: if the rankings repeat a candidate or name one from another election
+    """
+    candidate_ids = set(rankings)
+    if len(candidate_ids) != len(rankings):
+        raise InvalidBallot()
+    if candidate_ids:
+        running = session.query(func.count(Candidate.id)). \
+            filter(Candidate.election_id == election_id, Candidate.id.in_(candidate_ids)).scalar()
+        if running != len(candidate_ids):
+            raise InvalidBallot()
+    eligible = EligibleVoter.__table__
+    mark_voted = eligible.update(). \
+        where(and_(eligible.c.member_id == member_id,
+                   eligible.c.election_id == election_id,
+                   or_(eligible.c.voted.is_(None), eligible.c.voted == false()))). \
+        values(voted=True)
+    for _ in range(5):
+        if session.execute(mark_voted).rowcount != 1:
+            session.rollback()
+            is_eligible = session.query(exists().where(and_(
+                eligible.c.member_id == member_id, eligible.c.election_id == election_id))).scalar()
+            raise AlreadyVoted() if is_eligible else NotEligible()
+        vote_key = random.randint(10 ** (digits - 1), 10 ** digits - 1)
+        try:
+            vote_id = session.execute(Vote.__table__.insert().values(
+                vote_key=vote_key, election_id=election_id)).inserted_primary_key[0]
+        except IntegrityError:
+            # The key is taken, so start over with a new one
+            session.rollback()
+            continue
+        insert_rankings(session, {vote_id: rankings})
+        session.commit()
+        return vote_key
+    raise Exception('Failing to find a random key in five tries. Think something is wrong.')
+
+
+def insert_rankings(session: Session, rankings: Dict[int, List[int]]) -> None:
+    """
+    Inserts the rankings of ballots, keyed by vote id, with one executemany instead of flushing a
+    Ranking per candidate
+    """
+    rows = [{'vote_id': vote_id, 'rank': rank, 'candidate_id': candidate_id}
+            for vote_id, ranking in rankings.items() for rank, candidate_id in enumerate(ranking)]
+    if rows:
+        session.execute(Ranking.__table__.insert(), rows)
 
 
 @election_api.route('/election/voter', methods=['POST'])
@@ -175,55 +305,256 @@ def submit_vote(requester: Member, session: Session):
 def add_voter(requester: Member, session: Session):
     election_id = request.json['election_id']
     member_id = request.json.get('member_id', requester.id)
-    eligible_voter = EligibleVoter(member_id=member_id, election_id=election_id)
-    session.add(eligible_voter)
-    session.commit()
+    enroll_voters(session, election_id, member_ids=[member_id])
     return jsonify({'status': 'success'})
 
 
+@election_api.route('/election/voters', methods=['POST'])
+@requires_auth(admin=True)
+def add_voters(requester: Member, session: Session):
+    """
+    Makes many members eligible at once, either those listed in member_ids or those who attended
+    at least attended.meetings of the last attended.of_last meetings. Members who are already
+    eligible are skipped.
+    """
+    election_id = request.json['election_id']
+    member_ids = request.json.get('member_ids')
+    attended = request.json.get('attended')
+    if (member_ids is None) == (attended is None):
+        return BadRequest('Pass either member_ids or attended.')
+    try:
+        if attended is not None:
+            member_ids = None
+            min_meetings = int(attended['meetings'])
+            last_meetings = int(attended['of_last'])
+        else:
+            member_ids = [int(member_id) for member_id in member_ids]
+            min_meetings = last_meetings = None
+    except (KeyError, TypeError, ValueError):
+        return BadRequest('member_ids must be a list of ids, and attended must have integer '
+                          'meetings and of_last.')
+    count = enroll_voters(session, election_id, member_ids=member_ids,
+                          min_meetings=min_meetings, last_meetings=last_meetings)
+    return jsonify({'status': 'success', 'enrolled': count})
+
+
+def enroll_voters(session: Session, election_id: int, member_ids: Optional[List[int]]=None,
+                  min_meetings: Optional[int]=None, last_meetings: Optional[int]=None) -> int:
+    """
+    Makes members eligible for an election with a single INSERT ... SELECT and commit. If another
+    request enrolls some of the same members first, the insert is retried without them.
+    :param session: the session to run the insert in. It is committed
+    :param election_id: the election to enroll voters in
+    :param member_ids: the members to enroll. Ids that are not members are ignored
+    :param min_meetings: if member_ids is not given, enroll members who attended at least this
+        many of the last_meetings most recent meetings
+    :param last_meetings: how many of the most recent meetings min_meetings counts. Meetings that
+        have not started yet are left out, meetings without a start time are counted as past ones
+    :return: how many members were newly enrolled
+    """
+    if member_ids is not None:
+        if not member_ids:
+            return 0
+        members = select([Member.id.label('member_id')]).where(Member.id.in_(member_ids))
+    else:
+        recent = select([Meeting.id]). \
+            where(or_(Meeting.start_time.is_(None), Meeting.start_time <= datetime.now())). \
+            order_by(Meeting.start_time.desc(), Meeting.id.desc()). \
+            limit(last_meetings).alias('recent_meetings')
+        members = select([Attendee.member_id]). \
+            select_from(Attendee.__table__.join(recent, Attendee.meeting_id == recent.c.id)). \
+            group_by(Attendee.member_id). \
+            having(func.count(func.distinct(Attendee.meeting_id)) >= min_meetings)
+    members = members.alias('members_to_enroll')
+    already_eligible = exists().where(and_(EligibleVoter.member_id == members.c.member_id,
+                                           EligibleVoter.election_id == election_id))
+    new_voters = select([members.c.member_id, literal(election_id)]).where(~already_eligible)
+    insert = EligibleVoter.__table__.insert(). \
+        from_select(['member_id', 'election_id'], new_voters)
+    for _ in range(5):
+        try:
+            count = session.execute(insert).rowcount
+            session.commit()
+            return count
+        except IntegrityError:
+            session.rollback()
+    raise Exception('Failing to enroll voters in five tries. Think something is wrong.')
+
+
 @election_api.route('/election/count', methods=['GET'])
 @requires_auth(admin=True)
 def election_count(requester: Member, session: Session):
     election_id = request.args['id']
     election = session.query(Election).get(election_id)
-    stv = hold_election(election)
-    winners = [session.query(Candidate).get(cid).member.name for cid in stv.winners]
+    results = get_election_results(session, election)
+    names = get_candidate_names(session, election.id)
+    if request.args.get('format') == 'id':
+        # Key every round by candidate id and send each name once
+        round_information = {
+            round_number + 1: {vote_info['candidate_id']: {
+                'total_votes': vote_info['total_votes'],
+                'total_transfer_votes': vote_info['total_transfer_votes']} for vote_info in round}
+            for round_number, round in enumerate(results['rounds'])}
+        return custom_jsonify(data={'candidates': names,
+                                    'winners': results['winners'],
+                                    'round_information': round_information},
+                              encoder=CustomEncoder)
+    winners = [names[cid] for cid in results['winners']]
     round_information = {}
-    for round_number, round in enumerate(stv.previous_rounds):
+    for round_number, round in enumerate(results['rounds']):
         candidate_information = {}
-        for cid, vote_info in round.items():
-            candidate_name = session.query(Candidate).get(cid).member.name
-            candidate_information[candidate_name] = vote_info
+        for vote_info in round:
+            candidate_name = names[vote_info['candidate_id']]
+            candidate_information[candidate_name] = {
+                'total_votes': vote_info['total_votes'],
+                'total_transfer_votes': vote_info['total_transfer_votes']}
         round_information[round_number + 1] = candidate_information
     return custom_jsonify(data={'winners': winners, 'round_information': round_information},
                           encoder=CustomEncoder)
 
 
+def get_candidate_names(session: Session, election_id: int) -> Dict[int, str]:
+    """
+    Looks up the name of every candidate in an election with a single query
+    """
+    candidates = session.query(Candidate.id, Member.first_name, Member.last_name). \
+        join(Member, Candidate.member_id == Member.id). \
+        filter(Candidate.election_id == election_id)
+    return {cid: Member.format_name(first_name, last_name)
+            for cid, first_name, last_name in candidates}
+
+
 def hold_election(election: Election):
-    votes = [
-        [v.candidate_id for v in vote.ranking]
-        for vote in election.votes if vote.ranking
-    ]
-    candidate_ids = [c.id for c in election.candidates]
-    print("CANDIDATE_IDS: {}, VOTES: {}, NUM WINNERS: {}".format(candidate_ids, votes, election.number_winners))
-    stv = STVElection([c.id for c in election.candidates], election.number_winners, votes)
+    session = object_session(election)
+    candidate_ids = [cid for cid, in session.query(Candidate.id).filter_by(election_id=election.id)]
+    votes = get_ballots(session, election.id)
+    stv = ArraySTVElection(candidate_ids, election.number_winners, votes)
     stv.hold_election()
     return stv
 
 
-def create_vote(session: Session, election_id: int, digits: int):
-    i = 0
-    rolled_back = False
-    while i < 5:
+def get_election_results(session: Session, election: Election) -> dict:
+    """
+    Counts an election, reusing the stored count for as long as its ballots have not changed. Once
+    a count has been stored for a final election it is returned without checking the ballots.
+    :param session: the session to query with
+    :param election: the election to count
+    :return: the winning candidate ids and the totals of every round
+    """
+    final = election.status == 'final'
+    stored = session.query(ElectionResult).filter_by(election_id=election.id).one_or_none()
+    if stored and stored.final:
+        return stored.results
+    version = get_ballot_version(session, election)
+    if stored and stored.ballot_version == version:
+        if final:
+            stored.final = True
+            session.commit()
+        return stored.results
+
+    stv = hold_election(election)
+    results = {
+        'winners': stv.winners,
+        'rounds': [[{'candidate_id': cid,
+                     'total_votes': str(vote_info['total_votes']),
+                     'total_transfer_votes': str(vote_info['total_transfer_votes'])}
+                    for cid, vote_info in round.items()]
+                   for round in stv.previous_rounds]
+    }
+    if not stored:
+        stored = ElectionResult(election_id=election.id)
+        session.add(stored)
+    stored.ballot_version = version
+    stored.final = final
+    stored.results = results
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another request stored the same count first
+        session.rollback()
+    return results
+
+
+def get_ballot_version(session: Session, election: Election) -> str:
+    """
+    Summarizes everything an election's count depends on, so that adding, replacing or removing a
+    ballot, a candidate or a seat changes the result. Rankings are only ever deleted when they are
+    replaced, which bumps Election.rankings_replaced, so between replacements every new ranking
+    changes the number of rankings.
+    """
+    num_candidates = session.query(func.count(Candidate.id)). \
+        filter(Candidate.election_id == election.id).as_scalar()
+    rankings_replaced = session.query(Election.rankings_replaced). \
+        filter(Election.id == election.id).as_scalar()
+    num_rankings, last_ranking, num_candidates, rankings_replaced = session. \
+        query(func.count(Ranking.id), func.max(Ranking.id), num_candidates, rankings_replaced). \
+        select_from(Ranking). \
+        join(Vote, Ranking.vote_id == Vote.id). \
+        filter(Vote.election_id == election.id).one()
+    return '{}:{}:{}:{}:{}'.format(election.number_winners, num_candidates, rankings_replaced,
+                                   num_rankings, last_ranking)
+
+
+def get_ballots(session: Session, election_id: int, batch_size: int = 10000) -> Iterator[List[int]]:
+    """
+    Streams the ranked candidate ids of every ballot cast in an election from a single query
+    :param session: the session to query with
+    :param election_id: the election to load
+    :param batch_size: how many ranking rows to fetch from the database at a time
+    :return: the candidate ids of each ballot in rank order, skipping blank ballots
+    """
+    rows = session.query(Ranking.vote_id, Ranking.candidate_id). \
+        join(Vote, Ranking.vote_id == Vote.id). \
+        filter(Vote.election_id == election_id). \
+        order_by(Ranking.vote_id, Ranking.rank, Ranking.id). \
+        yield_per(batch_size)
+    for _, ranking in groupby(rows, key=itemgetter(0)):
+        yield [candidate_id for _, candidate_id in ranking]
+
+
+def create_votes(session: Session, election_id: int, digits: int, number: int) -> List[int]:
+    """
+    Claims many ballot keys at once. New keys are drawn in memory against the keys already used
+    and inserted with a single executemany and commit. If another request claims some of the same
+    keys first, only those keys are redrawn.
+    :param session: the session to insert the votes with
+    :param election_id: the election to claim ballots for
+    :param digits: how many digits each key has
+    :param number: how many ballots to claim
+    :return: the new ballot keys
+    """
+    if number <= 0:
+        return []
+    keys = set()  # type: Set[int]
+    for _ in range(5):
+        used = {key for key, in session.query(Vote.vote_key).filter_by(election_id=election_id)}
+        keys -= used
+        keys |= draw_keys(used | keys, digits, number - len(keys))
         try:
-            a = random.randint(10 ** (digits - 1), 10 ** digits - 1)
-            v = Vote(vote_key=a, election_id=election_id)
-            session.add(v)
+            session.execute(Vote.__table__.insert(),
+                            [{'vote_key': key, 'election_id': election_id} for key in keys])
             session.commit()
-            return v, rolled_back
+            return sorted(keys)
         except IntegrityError:
-            print('Had to retry')
-            i += 1
             session.rollback()
-            rolled_back = True
-    raise Exception('Failing to find a random key in five tries. Think something is wrong.')
+    raise Exception('Failing to insert random keys in five tries. Think something is wrong.')
+
+
+def draw_keys(used: Set[int], digits: int, number: int) -> Set[int]:
+    """
+    Picks distinct random keys with the given number of digits that are not in used
+    """
+    low, high = 10 ** (digits - 1), 10 ** digits - 1
+    # Votes cast online have longer keys, so only count the used keys in this range
+    free = high - low + 1 - sum(1 for key in used if low <= key <= high)
+    if number > free:
+        raise ValueError('Only {} ballot keys are left for this election.'.format(free))
+    if number > free // 2:
+        # Most of the remaining keys are needed, so drawing at random would keep hitting used ones
+        return set(random.sample([key for key in range(low, high + 1) if key not in used], number))
+    keys = set()  # type: Set[int]
+    while len(keys) < number:
+        key = random.randint(low, high)
+        if key not in used:
+            keys.add(key)
+    return keys
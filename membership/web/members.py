@@ -1,38 +1,94 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, g, jsonify, request
 from membership.database.base import Session
-from membership.database.models import Member, Committee, Role, Meeting, Attendee
-from membership.web.auth import create_auth0_user, requires_auth
-from membership.web.util import BadRequest
+from membership.database.models import Member, Committee, Role, Meeting, Attendee, EligibleVoter
+from membership.web import auth
+from membership.web.auth import Permissions, close_request_session, create_auth0_user, \
+    requires_auth
+from membership.web.util import BadRequest, STREAM_CHUNK_SIZE, stream_json
 from membership.util.email import send_welcome_email
+from sqlalchemy import and_, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import subqueryload
+from typing import List, Optional
 member_api = Blueprint('member_api', __name__)
+member_api.teardown_app_request(close_request_session)
+
+# the most members returned by one page of /member/list
+MEMBER_PAGE_SIZE = STREAM_CHUNK_SIZE
 
 
 @member_api.route('/member/list', methods=['GET'])
 @requires_auth(admin=True)
 def get_members(requester: Member, session: Session):
-    results = []
-    members = session.query(Member).all()
-    for member in members:
-        results.append({'id': member.id,
-                        'name': member.name,
-                        'email': member.email_address})
-    return jsonify(results)
+    """
+    Lists the id, name and email of members in id order. Passing limit, and after with the last id
+    of the previous page, returns one page along with the id to continue after. Without them every
+    member is streamed.
+    """
+    query = session.query(Member.id, Member.first_name, Member.last_name, Member.email_address). \
+        order_by(Member.id)
+    if 'limit' not in request.args and 'after' not in request.args:
+        return stream_json(query.yield_per(STREAM_CHUNK_SIZE), format_member_row)
+    try:
+        limit = min(int(request.args.get('limit', MEMBER_PAGE_SIZE)), MEMBER_PAGE_SIZE)
+        after = request.args.get('after')
+        if after:
+            query = query.filter(Member.id > int(after))
+    except ValueError:
+        return BadRequest('limit and after must be integers')
+    rows = query.limit(limit).all() if limit > 0 else []
+    return jsonify({'members': [format_member_row(row) for row in rows],
+                    'next': rows[-1].id if rows and len(rows) == limit else None})
+
+
+def format_member_row(row) -> dict:
+    return {'id': row.id,
+            'name': Member.format_name(row.first_name, row.last_name),
+            'email': row.email_address}
 
 
 @member_api.route('/member', methods=['GET'])
 @requires_auth(admin=False)
 def get_member(requester: Member, session: Session):
-    member = get_member_basics(requester)
+    # requires_auth already knows the requester's roles, so only the committee names are loaded
+    member = get_member_basics(requester, format_permissions(session, g.permissions))
     return jsonify(member)
 
 
-def get_member_basics(member: Member):
+def get_member_basics(member: Member, roles: Optional[List[dict]]=None):
+    if roles is None:
+        roles = [{'role': role.role, 'committee': role.committee.name
+                  if role.committee else 'general'} for role in member.roles]
     return {'id': member.id,
-            'info': {'first_name': member.first_name, 'last_name': member.last_name, 'biography': member.biography},
-            'roles':
-                [{'role': role.role, 'committee': role.committee.name
-                    if role.committee else 'general'} for role in member.roles]
-             }
+            'info': {'first_name': member.first_name, 'last_name': member.last_name,
+                     'biography': member.biography},
+            'roles': roles}
+
+
+def format_permissions(session: Session, permissions: Permissions) -> List[dict]:
+    """
+    Lists roles the way get_member_basics does, from a permission set instead of member.roles,
+    with at most one query for the committee names
+    """
+    committee_ids = {committee_id for committee_id, _ in permissions if committee_id is not None}
+    names = {}
+    if committee_ids:
+        names = dict(session.query(Committee.id, Committee.name).
+                     filter(Committee.id.in_(committee_ids)))
+    return [{'role': role, 'committee': names.get(committee_id, 'general')}
+            for committee_id, role in sorted(permissions, key=lambda p: (p[0] or 0, p[1]))]
+
+
+def load_member_details(session: Session, member_id: int) -> Member:
+    """
+    Loads a member along with everything get_member_details_helper reads, in four queries no matter
+    how many meetings, elections or roles the member has
+    """
+    return session.query(Member). \
+        options(subqueryload(Member.roles).joinedload(Role.committee),
+                subqueryload(Member.meetings_attended).joinedload(Attendee.meeting),
+                subqueryload(Member.eligible_votes).joinedload(EligibleVoter.election)). \
+        filter(Member.id == member_id).one_or_none()
 
 
 def get_member_details_helper(member: Member):
@@ -49,14 +105,14 @@ def get_member_details_helper(member: Member):
 @member_api.route('/member/details', methods=['GET'])
 @requires_auth(admin=False)
 def get_member_details(requester: Member, session: Session):
-    member = get_member_details_helper(requester)
-    return jsonify(member)
+    member = load_member_details(session, requester.id)
+    return jsonify(get_member_details_helper(member))
 
 
 @member_api.route('/admin/member/details', methods=['GET'])
 @requires_auth(admin=True)
 def get_member_info(requester: Member, session: Session):
-    other_member = session.query(Member).get(request.args['member_id'])
+    other_member = load_member_details(session, request.args['member_id'])
     return jsonify(get_member_details_helper(other_member))
 
 
@@ -74,9 +130,8 @@ def add_member(requester: Member, session: Session):
 @member_api.route('/committee/list', methods=['GET'])
 @requires_auth(admin=False)
 def get_committees(requester: Member, session: Session):
-    committees = session.query(Committee).all()
-    result = {c.id: c.name for c in committees}
-    return jsonify(result)
+    committees = session.query(Committee.id, Committee.name).order_by(Committee.id)
+    return stream_json(committees.yield_per(STREAM_CHUNK_SIZE), tuple, keyed=True)
 
 
 @member_api.route('/committee', methods=['POST'])
@@ -98,29 +153,44 @@ def add_committee(requester: Member, session: Session):
 @member_api.route('/meeting/list', methods=['GET'])
 @requires_auth(admin=False)
 def get_meetings(requester: Member, session: Session):
-    meetings = session.query(Meeting).all()
-    result = {m.id: m.name for m in meetings}
-    return jsonify(result)
+    meetings = session.query(Meeting.id, Meeting.name).order_by(Meeting.id)
+    return stream_json(meetings.yield_per(STREAM_CHUNK_SIZE), tuple, keyed=True)
 
 
 @member_api.route('/meeting/attend', methods=['POST'])
 @requires_auth(admin=False)
 def attend_meeting(requester: Member, session: Session):
     short_id = request.json['meeting_short_id']
-    meeting = session.query(Meeting).filter_by(short_id=short_id).one_or_none()
+    meeting = session.query(Meeting.id).filter_by(short_id=short_id).one_or_none()
     if not meeting:
         return BadRequest('Invalid meeting id')
-    if len(session.query(Attendee).filter_by(meeting_id=meeting.id,
-                                             member_id=requester.id).all()) > 0:
+    if not check_in(session, meeting.id, requester.id):
         return BadRequest('You have already logged into this meeting')
-    a = Attendee()
-    a.meeting = meeting
-    a.member = requester
-    session.add(a)
-    session.commit()
     return jsonify({'status': 'success'})
 
 
+def check_in(session: Session, meeting_id: int, member_id: int) -> bool:
+    """
+    Records that a member attended a meeting with a single INSERT. The unique constraint on
+    attendees rejects repeat check-ins, so kiosks can check in the same member at once without
+    racing. Any other integrity error, such as a missing meeting, is raised. Commits or rolls back
+    the session.
+    :return: whether this was the member's first check-in to the meeting
+    """
+    try:
+        session.execute(Attendee.__table__.insert().values(meeting_id=meeting_id,
+                                                           member_id=member_id))
+        session.commit()
+        return True
+    except IntegrityError:
+        session.rollback()
+        already_attended = session.query(exists().where(and_(
+            Attendee.meeting_id == meeting_id, Attendee.member_id == member_id))).scalar()
+        if not already_attended:
+            raise
+        return False
+
+
 @member_api.route('/meetings/<meeting_id>', methods=['GET'])
 @requires_auth(admin=False)
 def get_meeting(requester: Member, session: Session, meeting_id: int):
@@ -133,28 +203,29 @@ def get_meeting(requester: Member, session: Session, meeting_id: int):
 @member_api.route('/meetings/<meeting_id>/attendee', methods=['POST'])
 @requires_auth(admin=False)
 def attend_meeting_from_kiosk(requester: Member, session: Session, meeting_id: int):
-    meeting = session.query(Meeting).filter_by(id=meeting_id).one_or_none()
+    meeting = session.query(Meeting.id).filter_by(id=meeting_id).one_or_none()
     if not meeting:
         return BadRequest('Invalid meeting id')
     email_address = request.json['email_address']
     if not email_address:
         return BadRequest('You must supply an email address to check in')
-    member = session.query(Member).filter_by(email_address=email_address).one_or_none()
-    if not member:
-        member = Member()
-        member.first_name = request.json['first_name']
-        member.last_name = request.json['last_name']
-        member.email_address = email_address
-        session.commit()
+    member = session.query(Member.id).filter_by(email_address=email_address).one_or_none()
+    if member:
+        member_id = member.id
     else:
-        if len(session.query(Attendee).filter_by(meeting_id=meeting.id,
-                                                 member_id=member.id).all()) > 0:
-            return BadRequest('You have already logged into this meeting')
-    a = Attendee()
-    a.meeting = meeting
-    a.member = member
-    session.add(a)
-    session.commit()
+        new_member = Member(first_name=request.json['first_name'],
+                            last_name=request.json['last_name'],
+                            email_address=email_address)
+        session.add(new_member)
+        try:
+            session.commit()
+            member_id = new_member.id
+        except IntegrityError:
+            # Another kiosk added the same person first
+            session.rollback()
+            member_id = session.query(Member.id).filter_by(email_address=email_address).scalar()
+    if not check_in(session, meeting.id, member_id):
+        return BadRequest('You have already logged into this meeting')
     return jsonify({'status': 'success'})
 
 
@@ -166,6 +237,7 @@ def make_admin(requester: Member, session: Session):
     role = Role(member_id= member.id, role='admin', committee_id=committee_id)
     session.add(role)
     session.commit()
+    auth.auth_cache.invalidate_member(member.id)
     return jsonify({'status': 'success'})
 
 
@@ -177,6 +249,7 @@ def add_role(requester: Member, session: Session):
     role = Role(member_id=member_id, role=request.json['role'], committee_id=committee_id)
     session.add(role)
     session.commit()
+    auth.auth_cache.invalidate_member(member_id)
     return jsonify({'status': 'success'})
 
 
@@ -184,7 +257,11 @@ def add_role(requester: Member, session: Session):
 @requires_auth(admin=True)
 def add_meeting(requester: Member, session: Session):
     member_id = request.json.get('member_id', requester.id)
-    attend = Attendee(member_id=member_id, meeting_id=request.json['meeting_id'])
-    session.add(attend)
-    session.commit()
+    meeting_id = request.json['meeting_id']
+    if not session.query(exists().where(Meeting.id == meeting_id)).scalar():
+        return BadRequest('Invalid meeting id')
+    if not session.query(exists().where(Member.id == member_id)).scalar():
+        return BadRequest('Invalid member id')
+    if not check_in(session, meeting_id, member_id):
+        return BadRequest('This member has already logged into this meeting')
     return jsonify({'status': 'success'})
@@ -0,0 +1,110 @@
+from flask import Flask, g, has_app_context, request, Response
+import json
+import logging
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import time
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile:
+    """
+    The queries run while handling one request
+    """
+
+    def __init__(self) -> None:
+        self.start = time.time()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.statements = []  # type: List[Tuple[float, str]]
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.query_count += 1
+        self.query_time += seconds
+        self.statements.append((seconds, statement))
+
+    def slowest(self, n: int) -> List[Tuple[float, str]]:
+        return sorted(self.statements, key=lambda s: s[0], reverse=True)[:n]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The execution context only lives as long as the statement, so a statement that fails leaves
+    # nothing behind on the pooled connection
+    if context is not None:
+        context.query_start_time = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = g.get('request_profile') if has_app_context() else None
+    if profile is not None and context is not None:
+        profile.record(statement, time.time() - context.query_start_time)
+
+
+def init_profiling(app: Flask, engine: Engine, budget: int=0, slowest: int=3,
+                   strict: bool=False) -> None:
+    """
+    Records the queries of every request handled by an app. Each response reports them in the
+    X-Query-Count, X-Query-Time and X-Request-Time headers (times in milliseconds), and a summary
+    with the slowest statements is logged as JSON. The headers of a streamed response are sent
+    before its body is iterated, so they leave out the queries that produce the body, but its
+    summary is logged when the response is closed and includes them.
+    :param app: the app to profile
+    :param engine: the engine whose queries are counted
+    :param budget: the most queries a request may run, or 0 for no limit
+    :param slowest: how many of the slowest statements to log
+    :param strict: raise QueryBudgetExceeded instead of logging requests over the budget, to fail
+        tests. A streamed response raises it when it is closed
+    """
+    if not event.contains(engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def log_profile(profile: RequestProfile, summary: dict) -> None:
+        request_time = time.time() - profile.start
+        summary.update({
+            'query_count': profile.query_count,
+            'query_time_ms': round(profile.query_time * 1000, 1),
+            'request_time_ms': round(request_time * 1000, 1),
+            'slowest': [{'time_ms': round(seconds * 1000, 1), 'statement': statement}
+                        for seconds, statement in profile.slowest(slowest)],
+        })
+        if 0 < budget < profile.query_count:
+            summary['query_budget'] = budget
+            if strict:
+                raise QueryBudgetExceeded('{} {} ran {} queries, more than its budget of {}'.format(
+                    summary['method'], summary['path'], profile.query_count, budget))
+            logger.warning(json.dumps(summary))
+        else:
+            logger.info(json.dumps(summary))
+
+    @app.before_request
+    def start_profile():
+        g.request_profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response: Response) -> Response:
+        profile = g.get('request_profile')
+        if profile is None:
+            return response
+        response.headers['X-Query-Count'] = str(profile.query_count)
+        response.headers['X-Query-Time'] = '{:.1f}'.format(profile.query_time * 1000)
+        response.headers['X-Request-Time'] = '{:.1f}'.format((time.time() - profile.start) * 1000)
+        summary = {
+            'method': request.method,
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'status': response.status_code,
+        }
+        if response.is_streamed:
+            # The profile stays in g, so the queries run while the body is sent are still recorded
+            response.call_on_close(lambda: log_profile(profile, summary))
+        else:
+            g.pop('request_profile')
+            log_profile(profile, summary)
+        return response
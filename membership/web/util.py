@@ -3,15 +3,18 @@ from enum import Enum
 import json
 
 from decimal import Decimal
-from flask import Response
+from flask import Response, stream_with_context
 import logging
 
 from flask.json import JSONEncoder
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from typing import List
+from typing import Any, Callable, Iterable, Iterator, List, Type
 
 logger = logging.getLogger(__name__)
 
+# how many rows to fetch from the database and serialize at a time when streaming a response
+STREAM_CHUNK_SIZE = 1000
+
 
 class BadRequest(Response):
     def __init__(self, err: str) -> None:
@@ -73,3 +76,43 @@ def custom_jsonify(data, encoder, status=200) -> Response:
     return Response(
         status=status, response=json.dumps(
             data, cls=encoder), content_type='application/json')
+
+
+def iter_json(rows: Iterable, serialize: Callable[[Any], Any], keyed: bool=False,
+              encoder: Type[json.JSONEncoder]=json.JSONEncoder,
+              chunk_size: int=STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Serializes rows into a JSON list, or into a JSON object if keyed, a chunk of rows at a time
+    :param rows: the rows to serialize, usually a query run with yield_per
+    :param serialize: turns a row into a value, or into a (key, value) pair if keyed
+    :param keyed: whether to build an object instead of a list
+    :param encoder: the JSON encoder for the values
+    :param chunk_size: how many rows to serialize into each chunk
+    """
+    yield '{' if keyed else '['
+    chunk = []  # type: List[str]
+    separator = ''
+    for row in rows:
+        if keyed:
+            key, value = serialize(row)
+            chunk.append(json.dumps(str(key)) + ':' + json.dumps(value, cls=encoder))
+        else:
+            chunk.append(json.dumps(serialize(row), cls=encoder))
+        if len(chunk) >= chunk_size:
+            yield separator + ','.join(chunk)
+            chunk = []
+            separator = ','
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield '}' if keyed else ']'
+
+
+def stream_json(rows: Iterable, serialize: Callable[[Any], Any], keyed: bool=False,
+                encoder: Type[json.JSONEncoder]=json.JSONEncoder,
+                chunk_size: int=STREAM_CHUNK_SIZE) -> Response:
+    """
+    Streams rows as a JSON response without building it in memory. The request, and its session,
+    stay open until the last row has been sent. See iter_json for the arguments.
+    """
+    chunks = iter_json(rows, serialize, keyed=keyed, encoder=encoder, chunk_size=chunk_size)
+    return Response(stream_with_context(chunks), content_type='application/json')
@@ -1,8 +1,56 @@
+import pytest
 from membership.database import base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 
 def pytest_configure(config):
     base.engine = create_engine('sqlite://', pool_size=10, pool_recycle=3600)
-    base.Session = sessionmaker(bind=base.engine)
\ No newline at end of file
+    base.Session = sessionmaker(bind=base.engine)
+
+
+@pytest.fixture
+def login_as(monkeypatch):
+    """
+    Turns external auth off and returns a function that makes requests authenticate as the member
+    with an email address, creating them, as an admin unless admin=False, if they do not exist.
+    Every test starts with an empty auth cache.
+    """
+    # Imported here so that the app binds to the test engine set up in pytest_configure
+    from membership.database.models import Member, Role
+    from membership.web import auth
+    monkeypatch.setattr(auth, 'USE_AUTH', False)
+    monkeypatch.setattr(auth, 'auth_cache', auth.AuthCache(max_size=10, ttl=60))
+
+    def login(email_address: str, first_name: str='Admin', admin: bool=True) -> int:
+        monkeypatch.setattr(auth, 'NO_AUTH_EMAIL', email_address)
+        session = base.Session()
+        try:
+            member = session.query(Member).filter_by(email_address=email_address).one_or_none()
+            if not member:
+                member = Member(first_name=first_name, email_address=email_address)
+                session.add(member)
+                if admin:
+                    session.add(Role(member=member, role='admin'))
+                session.commit()
+            return member.id
+        finally:
+            session.close()
+
+    return login
+
+
+@pytest.fixture
+def statements():
+    """
+    Records the SQL of every statement run on the test engine for the rest of the test. Clear it
+    with del statements[:] to start counting from a known point.
+    """
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    event.listen(base.engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(base.engine, 'before_cursor_execute', record)
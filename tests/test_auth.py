@@ -0,0 +1,108 @@
+import json
+import time
+
+from flask import Flask, jsonify
+
+from membership.database.base import engine, metadata, Session
+from membership.database.models import Member, Role
+from membership.web import auth
+from membership.web.auth import AuthCache, GLOBAL_ADMIN, get_permissions, requires_auth
+from membership.web.members import member_api
+
+
+def test_auth_cache():
+    cache = AuthCache(max_size=2, ttl=60)
+    cache.put('a', {'email': 'a@example.com'}, 1, frozenset())
+    cache.put('b', {'email': 'b@example.com'}, 2, frozenset([GLOBAL_ADMIN]))
+    assert cache.get('a').member_id == 1
+    # 'b' is now the least recently used token
+    cache.put('c', {'email': 'c@example.com'}, 3, frozenset())
+    assert cache.get('b') is None
+    assert cache.get('c').member_id == 3
+
+    cache.invalidate_member(1)
+    assert cache.get('a') is None
+    assert cache.get('c') is not None
+
+
+def test_auth_cache_expiry():
+    cache = AuthCache(max_size=10, ttl=60)
+    cache.put('expired', {'exp': time.time() - 1}, 1, frozenset())
+    assert cache.get('expired') is None
+    cache = AuthCache(max_size=10, ttl=0)
+    cache.put('stale', {}, 1, frozenset())
+    assert cache.get('stale') is None
+
+
+class TestRequiresAuth:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(engine)
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(engine)
+
+    def test_cached_admin(self, login_as):
+        member_id = login_as('cached@example.com', 'Cached', admin=False)
+
+        app = Flask(__name__)
+        # The blueprint closes the request session when each request ends
+        app.register_blueprint(member_api)
+
+        @app.route('/admin-only')
+        @requires_auth(admin=True)
+        def admin_only(requester, session):
+            return jsonify({'id': requester.id})
+
+        client = app.test_client()
+        assert client.get('/admin-only').status_code == 401
+
+        # The cached entry says the member is not an admin, so granting the role through the API
+        # has to forget it
+        login_as('granter@example.com')
+        response = client.post('/member/role', data=json.dumps({
+            'member_id': member_id, 'role': 'admin', 'committee_id': '0'}),
+            content_type='application/json')
+        assert response.status_code == 200
+        login_as('cached@example.com')
+        assert client.get('/admin-only').status_code == 200
+        assert auth.auth_cache.get('cached@example.com').is_admin
+
+    def test_cached_requester(self, login_as, statements):
+        member_id = login_as('lazy@example.com', 'Lazy', admin=False)
+
+        app = Flask(__name__)
+        # The blueprint closes the request session when each request ends
+        app.register_blueprint(member_api)
+
+        @app.route('/whoami')
+        @requires_auth(admin=False)
+        def whoami(requester, session):
+            return jsonify({'id': requester.id})
+
+        @app.route('/name')
+        @requires_auth(admin=False)
+        def name(requester, session):
+            return jsonify({'name': requester.first_name})
+
+        client = app.test_client()
+        assert json.loads(client.get('/whoami').get_data(as_text=True)) == {'id': member_id}
+        del statements[:]
+        # A cached requester never touches the database unless the handler needs it
+        assert json.loads(client.get('/whoami').get_data(as_text=True)) == {'id': member_id}
+        assert statements == []
+        assert json.loads(client.get('/name').get_data(as_text=True)) == {'name': 'Lazy'}
+        assert len(statements) == 1
+        assert not auth.request_session.registry.has()
+
+    def test_get_permissions(self):
+        session = Session()
+        member = Member(first_name='Roles', email_address='roles@example.com')
+        session.add(member)
+        session.commit()
+        session.add_all([Role(member_id=member.id, role='admin'),
+                         Role(member_id=member.id, role='member', committee_id=3)])
+        session.commit()
+        assert get_permissions(session, member.id) == {GLOBAL_ADMIN, (3, 'member')}
+        session.close()
@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy.exc import TimeoutError
+
+from membership.database.base import InstrumentedQueuePool, create_pool_engine, pool_stats
+
+
+def test_pool_stats():
+    pool_stats.reset()
+    pool_engine = create_pool_engine(name_or_url='sqlite://', pool_size=1, max_overflow=0,
+                                     pool_timeout=0.1)
+    assert isinstance(pool_engine.pool, InstrumentedQueuePool)
+    with pool_engine.connect() as connection:
+        connection.execute('select 1')
+        stats = pool_stats.snapshot(pool_engine.pool)
+        assert stats['checkouts'] == 1
+        assert stats['checked_out'] == 1
+        assert stats['max_checked_out'] == 1
+        # The only connection is in use, so the next checkout waits and gives up
+        with pytest.raises(TimeoutError):
+            pool_engine.connect()
+    stats = pool_stats.snapshot(pool_engine.pool)
+    assert stats['timeouts'] == 1
+    assert stats['max_wait_time'] >= 0.1
+    assert stats['checked_out'] == 0
+    assert stats['size'] == 1
@@ -1,6 +1,13 @@
-from membership.database.models import Candidate, Member, Election, Vote, Ranking
+from datetime import datetime, timedelta
+import json
+from membership.database.models import Attendee, Candidate, Member, Election, ElectionResult, \
+    EligibleVoter, Meeting, Vote, Ranking
 from membership.database.base import engine, metadata, Base, Session
-from membership.web.elections import hold_election
+from membership.web.base_app import app
+from membership.web.elections import AlreadyVoted, InvalidBallot, NotEligible, cast_vote, \
+    create_votes, draw_keys, enroll_voters, get_ballots, get_candidate_names, \
+    get_election_results, hold_election, reconcile_paper_ballots
+import pytest
 from random import shuffle
 from hypothesis.strategies import data
 from hypothesis import given
@@ -61,7 +68,7 @@ class TestElection:
 
         # Check the results
         assert len(results.winners) == num_winners
-        assert len(results.votes) == num_votes
+        assert results.num_ballots == num_votes
 
     def test_election(self):
         num_votes = 500
@@ -96,4 +103,316 @@ class TestElection:
         election = session.query(Election).filter_by(name='Test').one()
         results = hold_election(election)
         assert len(results.winners) == 2
-        assert len(results.votes) == num_votes
+        assert results.num_ballots == num_votes
+
+    def test_get_ballots(self, statements):
+        session = Session()
+        members = [Member(first_name=name) for name in ['G', 'H', 'I']]
+        candidates = [Candidate(member=member) for member in members]
+        election = Election(name='Ballots', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        for ranking in [[2, 0, 1], [1], [], [0, 2]]:
+            vote = Vote()
+            election.votes.append(vote)
+            for rank, i in reversed(list(enumerate(ranking))):
+                vote.ranking.append(Ranking(rank=rank, candidate=candidates[i]))
+        session.commit()
+        ids = [c.id for c in candidates]
+
+        assert list(get_ballots(session, election.id)) == [[ids[2], ids[0], ids[1]], [ids[1]],
+                                                           [ids[0], ids[2]]]
+
+        del statements[:]
+        results = hold_election(election)
+        session.close()
+        assert results.num_ballots == 3
+        assert len(statements) == 2
+
+    def test_election_results(self):
+        session = Session()
+        members = [Member(first_name=name) for name in ['J', 'K']]
+        candidates = [Candidate(member=member) for member in members]
+        election = Election(name='Results', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        for ranking in [[0, 1], [1], [1, 0]]:
+            vote = Vote()
+            election.votes.append(vote)
+            for rank, i in enumerate(ranking):
+                vote.ranking.append(Ranking(rank=rank, candidate=candidates[i]))
+        session.commit()
+
+        results = get_election_results(session, election)
+        assert results['winners'] == [candidates[1].id]
+        assert get_election_results(session, election) == results
+        stored = session.query(ElectionResult).filter_by(election_id=election.id).one()
+        version = stored.ballot_version
+
+        # New ballots invalidate the stored count until the election is final
+        for _ in range(2):
+            vote = Vote()
+            election.votes.append(vote)
+            vote.ranking.append(Ranking(rank=0, candidate=candidates[0]))
+        session.commit()
+        results = get_election_results(session, election)
+        assert results['winners'] == [candidates[0].id]
+        assert stored.ballot_version != version
+
+        election.status = 'final'
+        session.commit()
+        assert get_election_results(session, election) == results
+        assert stored.final
+        session.close()
+
+    def test_election_results_after_override(self):
+        session = Session()
+        candidates = [Candidate(member=Member(first_name=name)) for name in ['X', 'Y']]
+        election = Election(name='Override', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        session.commit()
+        x, y = [candidate.id for candidate in candidates]
+        keys = create_votes(session, election.id, 5, 3)
+        reconcile_paper_ballots(session, election.id, [(keys[0], [x]), (keys[1], [y]),
+                                                       (keys[2], [y])])
+        assert get_election_results(session, election)['winners'] == [y]
+
+        # The replaced ranking can get the same id back, but the stored count is still redone
+        reconcile_paper_ballots(session, election.id, [(keys[2], [x])], override=True)
+        assert sorted(get_ballots(session, election.id)) == [[x], [x], [y]]
+        assert get_election_results(session, election)['winners'] == [x]
+        session.close()
+
+    def test_election_count(self, login_as):
+        login_as('count@example.com', 'Count')
+        session = Session()
+        candidates = [Candidate(member=Member(first_name=first_name, last_name=last_name))
+                      for first_name, last_name in [('Ada', 'Lovelace'), ('Bo', None), ('Cy', 'D')]]
+        election = Election(name='Count', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        for ranking in [[0, 1], [0], [1], [1, 0], [2, 0]]:
+            vote = Vote()
+            election.votes.append(vote)
+            for rank, i in enumerate(ranking):
+                vote.ranking.append(Ranking(rank=rank, candidate=candidates[i]))
+        session.commit()
+        election_id = election.id
+        a, b, c = [str(candidate.id) for candidate in candidates]
+        session.close()
+
+        client = app.test_client()
+        response = client.get('/election/count?id={}'.format(election_id))
+        by_name = json.loads(response.get_data(as_text=True))
+        response = client.get('/election/count?id={}&format=id'.format(election_id))
+        by_id = json.loads(response.get_data(as_text=True))
+
+        assert by_id['candidates'] == {a: 'Ada Lovelace', b: 'Bo', c: 'Cy D'}
+        assert by_name['winners'] == ['Ada Lovelace']
+        assert by_id['winners'] == [int(a)]
+        assert by_id['round_information']['1'] == {
+            a: {'total_votes': '2.00000', 'total_transfer_votes': '0.00000'},
+            b: {'total_votes': '2.00000', 'total_transfer_votes': '0.00000'},
+            c: {'total_votes': '1.00000', 'total_transfer_votes': '0.00000'}}
+        # Both formats hold the same rounds, keyed by name or by id
+        assert len(by_id['round_information']) > 1
+        assert by_name['round_information'] == {
+            round_number: {by_id['candidates'][cid]: totals for cid, totals in round.items()}
+            for round_number, round in by_id['round_information'].items()}
+
+    def test_get_candidate_names(self):
+        session = Session()
+        members = [Member(first_name='L', last_name='M'), Member(first_name='N')]
+        candidates = [Candidate(member=member) for member in members]
+        election = Election(name='Names', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        session.commit()
+        assert get_candidate_names(session, election.id) == {candidates[0].id: 'L M',
+                                                             candidates[1].id: 'N'}
+        session.close()
+
+    def test_enroll_voters(self):
+        session = Session()
+        members = [Member(first_name='Voter', last_name=str(i)) for i in range(4)]
+        meetings = [Meeting(name='Enroll {}'.format(i), short_id=1000 + i,
+                            start_time=datetime(2017, 1, i + 1)) for i in range(4)]
+        # Meetings that have not happened yet are not among the last ones
+        upcoming = [Meeting(name='Upcoming {}'.format(i), short_id=1010 + i,
+                            start_time=datetime.now() + timedelta(days=i + 1)) for i in range(2)]
+        election = Election(name='Enroll', number_winners=1)
+        session.add_all(members + meetings + upcoming + [election])
+        # Member 0 went to every meeting, member 1 to the last two, member 2 to the first two and
+        # member 3 to none
+        session.add_all([Attendee(member=members[0], meeting=meeting) for meeting in meetings] +
+                        [Attendee(member=members[1], meeting=meeting) for meeting in meetings[2:]] +
+                        [Attendee(member=members[2], meeting=meeting) for meeting in meetings[:2]])
+        session.commit()
+
+        def eligible():
+            return {member_id for member_id, in session.query(EligibleVoter.member_id).
+                    filter_by(election_id=election.id)}
+
+        assert enroll_voters(session, election.id, min_meetings=2, last_meetings=3) == 2
+        assert eligible() == {members[0].id, members[1].id}
+        assert enroll_voters(session, election.id, min_meetings=2, last_meetings=3) == 0
+        member_ids = [member.id for member in members] + [members[3].id + 1000]
+        assert enroll_voters(session, election.id, member_ids=member_ids) == 2
+        assert eligible() == {member.id for member in members}
+        assert session.query(EligibleVoter).filter_by(election_id=election.id).count() == 4
+        session.close()
+
+    def test_add_voters(self, login_as):
+        member_id = login_as('enroll@example.com', 'Enroll')
+        session = Session()
+        others = [Member(first_name='Enrolled', last_name=str(i)) for i in range(2)]
+        election = Election(name='Add voters', number_winners=1)
+        session.add_all(others + [election])
+        session.commit()
+        election_id = election.id
+        other_ids = [member.id for member in others]
+        session.close()
+
+        client = app.test_client()
+
+        def post(url, body):
+            body['election_id'] = election_id
+            return client.post(url, data=json.dumps(body), content_type='application/json')
+
+        # Enrolling someone twice, alone or in bulk, leaves them eligible once
+        for _ in range(2):
+            assert post('/election/voter', {}).status_code == 200
+        response = post('/election/voters', {'member_ids': [member_id] + other_ids})
+        assert json.loads(response.get_data(as_text=True))['enrolled'] == 2
+        assert post('/election/voter', {'member_id': other_ids[0]}).status_code == 200
+        session = Session()
+        assert session.query(EligibleVoter).filter_by(election_id=election_id).count() == 3
+        session.close()
+
+    def test_create_votes(self):
+        session = Session()
+        election = Election(name='Paper', number_winners=1)
+        session.add(election)
+        session.commit()
+        keys = create_votes(session, election.id, 2, 80)
+        assert len(set(keys)) == 80
+        assert all(10 <= key <= 99 for key in keys)
+        # Only ten two digit keys are left, so they are all handed out
+        assert sorted(keys + create_votes(session, election.id, 2, 10)) == list(range(10, 100))
+        with pytest.raises(ValueError):
+            create_votes(session, election.id, 2, 1)
+        assert session.query(Vote).filter_by(election_id=election.id).count() == 90
+        session.close()
+
+    def test_draw_keys(self):
+        used = {100, 101, 5, 123456}
+        keys = draw_keys(used, 3, 500)
+        assert len(keys) == 500
+        assert not keys & used
+        assert len(draw_keys(used, 3, 898)) == 898
+
+    def test_cast_vote(self):
+        session = Session()
+        voters = [Member(first_name='Caster', last_name=str(i)) for i in range(3)]
+        candidates = [Candidate(member=Member(first_name='Cast candidate')) for _ in range(2)]
+        election = Election(name='Cast', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add_all([EligibleVoter(member=voters[0], election=election),
+                         EligibleVoter(member=voters[1], election=election, voted=False)])
+        session.add(voters[2])
+        session.commit()
+        rankings = [candidates[1].id, candidates[0].id]
+
+        vote_key = cast_vote(session, election.id, voters[0].id, rankings)
+        vote = session.query(Vote).filter_by(election_id=election.id, vote_key=vote_key).one()
+        assert [ranking.candidate_id for ranking in vote.ranking] == rankings
+        with pytest.raises(AlreadyVoted):
+            cast_vote(session, election.id, voters[0].id, rankings)
+        with pytest.raises(NotEligible):
+            cast_vote(session, election.id, voters[2].id, rankings)
+        other = Candidate(member=voters[2], election=Election(name='Other', number_winners=1))
+        session.add(other)
+        session.commit()
+        for invalid in ([candidates[0].id, other.id], [candidates[0].id, candidates[0].id]):
+            with pytest.raises(InvalidBallot):
+                cast_vote(session, election.id, voters[1].id, invalid)
+        # A blank ballot still uses up the member's vote
+        cast_vote(session, election.id, voters[1].id, [])
+        assert session.query(Vote).filter_by(election_id=election.id).count() == 2
+        assert all(eligible.voted for eligible in
+                   session.query(EligibleVoter).filter_by(election_id=election.id))
+        session.close()
+
+    def test_submit_paper_vote(self, login_as):
+        login_as('paper@example.com', 'Paper')
+        session = Session()
+        candidates = [Candidate(member=Member(first_name='Paper candidate')) for _ in range(3)]
+        election = Election(name='Paper entry', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        session.commit()
+        election_id = election.id
+        candidate_ids = [candidate.id for candidate in candidates]
+        vote_key, = create_votes(session, election_id, 5, 1)
+        session.close()
+
+        client = app.test_client()
+
+        def enter(rankings, override=False):
+            response = client.post('/vote/paper', data=json.dumps({
+                'election_id': election_id, 'ballot_key': vote_key, 'rankings': rankings,
+                'override': override}), content_type='application/json')
+            return json.loads(response.get_data(as_text=True))['status']
+
+        assert enter(candidate_ids[:2]) == 'new'
+        assert enter(candidate_ids[:2]) == 'match'
+        assert enter(candidate_ids[1::-1]) == 'mismatch'
+        assert enter(candidate_ids[:1]) == 'mismatch'
+        assert enter(candidate_ids[::-1], override=True) == 'new'
+        assert enter(candidate_ids[::-1]) == 'match'
+        response = client.post('/vote/paper', data=json.dumps({
+            'election_id': election_id, 'ballot_key': 'x', 'rankings': candidate_ids}),
+            content_type='application/json')
+        assert response.status_code == 400
+        session = Session()
+        assert list(get_ballots(session, election_id)) == [candidate_ids[::-1]]
+        session.close()
+
+    def test_submit_paper_votes(self, login_as, statements):
+        login_as('box@example.com', 'Box')
+        session = Session()
+        candidates = [Candidate(member=Member(first_name='Box candidate')) for _ in range(3)]
+        election = Election(name='Ballot box', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        session.commit()
+        election_id = election.id
+        a, b, c = [candidate.id for candidate in candidates]
+        keys = create_votes(session, election_id, 5, 3)
+        session.close()
+
+        client = app.test_client()
+
+        def enter(ballots, override=False):
+            response = client.post('/vote/paper/batch', data=json.dumps({
+                'election_id': election_id, 'override': override,
+                'ballots': [{'ballot_key': key, 'rankings': rankings}
+                            for key, rankings in ballots]}), content_type='application/json')
+            ballots = json.loads(response.get_data(as_text=True))['ballots']
+            return [ballot['status'] for ballot in ballots]
+
+        client.get('/election/list')
+        # Loading the election, loading the ballots and inserting the new rankings
+        del statements[:]
+        assert enter([(keys[0], [a, b]), (keys[1], [c]), (keys[0], [b])]) == \
+            ['new', 'new', 'mismatch']
+        assert len(statements) == 3
+        del statements[:]
+        assert enter([(keys[0], [a, b]), (keys[1], [b]), (keys[2], [c]), (1, [a])]) == \
+            ['match', 'mismatch', 'new', 'not claimed']
+        assert len(statements) == 3
+        assert enter([(keys[1], [b, a])], override=True) == ['new']
+        session = Session()
+        assert sorted(get_ballots(session, election_id)) == sorted([[a, b], [b, a], [c]])
+        session.close()
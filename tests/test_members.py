@@ -0,0 +1,137 @@
+import json
+import pytest
+
+from membership.database.base import engine, metadata, Session
+from membership.database.models import Attendee, Committee, Election, EligibleVoter, Meeting, \
+    Member, Role
+from membership.web.base_app import app
+
+
+class TestMembers:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(engine)
+        session = Session()
+        admin = Member(first_name='Admin', email_address='admin@example.com')
+        session.add(admin)
+        session.add(Role(member=admin, role='admin'))
+        session.add_all([Member(first_name='Member', last_name=str(i),
+                                email_address='member{}@example.com'.format(i))
+                         for i in range(9)])
+        session.add_all([Committee(name='Committee {}'.format(i)) for i in range(3)])
+        session.add_all([Meeting(name='Meeting {}'.format(i), short_id=i) for i in range(3)])
+        session.commit()
+        session.close()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(engine)
+
+    @pytest.fixture
+    def client(self, login_as):
+        login_as('admin@example.com')
+        return app.test_client()
+
+    def test_list_members(self, client):
+        members = json.loads(client.get('/member/list').get_data(as_text=True))
+        assert len(members) == 10
+        assert members[0] == {'id': 1, 'name': 'Admin', 'email': 'admin@example.com'}
+        assert members[1] == {'id': 2, 'name': 'Member 0', 'email': 'member0@example.com'}
+
+    def test_page_members(self, client):
+        everyone = json.loads(client.get('/member/list').get_data(as_text=True))
+        pages = []
+        after = ''
+        while after is not None:
+            response = client.get('/member/list?limit=4&after={}'.format(after))
+            page = json.loads(response.get_data(as_text=True))
+            pages.append(page['members'])
+            after = page['next']
+        assert [len(page) for page in pages] == [4, 4, 2]
+        assert [member for page in pages for member in page] == everyone
+        assert client.get('/member/list?limit=x').status_code == 400
+
+    def test_list_committees_and_meetings(self, client):
+        assert json.loads(client.get('/committee/list').get_data(as_text=True)) == {
+            '1': 'Committee 0', '2': 'Committee 1', '3': 'Committee 2'}
+        assert json.loads(client.get('/meeting/list').get_data(as_text=True)) == {
+            '1': 'Meeting 0', '2': 'Meeting 1', '3': 'Meeting 2'}
+
+    def test_get_member(self, client, statements):
+        session = Session()
+        admin = session.query(Member).filter_by(email_address='admin@example.com').one()
+        committee = session.query(Committee).filter_by(name='Committee 1').one()
+        session.add(Role(member=admin, role='chair', committee=committee))
+        session.commit()
+        session.close()
+
+        client.get('/member')
+        del statements[:]
+        member = json.loads(client.get('/member').get_data(as_text=True))
+        # Loading the cached requester and the committee names, but not their roles
+        assert len(statements) == 2
+        assert {'role': 'admin', 'committee': 'general'} in member['roles']
+        assert {'role': 'chair', 'committee': 'Committee 1'} in member['roles']
+        details = json.loads(client.get('/member/details').get_data(as_text=True))
+        assert sorted(member['roles'], key=str) == sorted(details['roles'], key=str)
+
+    def test_member_details_queries(self, client, statements):
+        session = Session()
+        admin = session.query(Member).filter_by(email_address='admin@example.com').one()
+        committee = session.query(Committee).first()
+        session.add(Role(member=admin, role='member', committee=committee))
+        for i in range(5):
+            meeting = Meeting(name='Detail meeting {}'.format(i), short_id=100 + i)
+            election = Election(name='Election {}'.format(i))
+            session.add_all([Attendee(member=admin, meeting=meeting),
+                             EligibleVoter(member=admin, election=election, voted=bool(i % 2))])
+        session.commit()
+        admin_id = admin.id
+        session.close()
+
+        client.get('/member')
+        del statements[:]
+        details = json.loads(client.get('/member/details').get_data(as_text=True))
+        assert len(statements) == 4
+        del statements[:]
+        response = client.get('/admin/member/details?member_id={}'.format(admin_id))
+        assert json.loads(response.get_data(as_text=True)) == details
+        assert len(statements) == 4
+        assert details['meetings'] == ['Detail meeting {}'.format(i) for i in range(5)]
+        assert len(details['votes']) == 5
+        assert {'role': 'member', 'committee': 'Committee 0'} in details['roles']
+
+    def test_check_in(self, client):
+        session = Session()
+        meeting = Meeting(name='Check in', short_id=200)
+        session.add(meeting)
+        session.commit()
+        meeting_id = meeting.id
+        session.close()
+
+        def post(url, body):
+            return client.post(url, data=json.dumps(body), content_type='application/json')
+
+        assert post('/meeting/attend', {'meeting_short_id': 200}).status_code == 200
+        assert post('/meeting/attend', {'meeting_short_id': 200}).status_code == 400
+        assert post('/meeting/attend', {'meeting_short_id': 201}).status_code == 400
+        kiosk = {'email_address': 'kiosk@example.com', 'first_name': 'Kiosk', 'last_name': 'New'}
+        url = '/meetings/{}/attendee'.format(meeting_id)
+        assert post(url, kiosk).status_code == 200
+        assert post(url, kiosk).status_code == 400
+        session = Session()
+        kiosk_member = session.query(Member).filter_by(email_address='kiosk@example.com').one()
+        assert kiosk_member.name == 'Kiosk New'
+        attend = {'member_id': kiosk_member.id, 'meeting_id': meeting_id}
+        assert post('/member/attendee', attend).status_code == 400
+        assert post('/member/attendee', dict(attend, meeting_id=999)).status_code == 400
+        assert post('/member/attendee', dict(attend, member_id=999)).status_code == 400
+        other_meeting = Meeting(name='Check in later', short_id=202)
+        session.add(other_meeting)
+        session.commit()
+        attend['meeting_id'] = other_meeting.id
+        assert post('/member/attendee', attend).status_code == 200
+        assert post('/member/attendee', attend).status_code == 400
+        assert session.query(Attendee).filter_by(meeting_id=meeting_id).count() == 2
+        assert session.query(Attendee).filter_by(member_id=kiosk_member.id).count() == 2
+        session.close()
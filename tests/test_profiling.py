@@ -0,0 +1,88 @@
+import json
+import logging
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy.exc import OperationalError
+
+from membership.database.base import engine, Session
+from membership.web.profiling import QueryBudgetExceeded, init_profiling
+from membership.web.util import stream_json
+
+
+def make_app(**kwargs):
+    app = Flask(__name__)
+    app.testing = True
+    init_profiling(app, engine, **kwargs)
+
+    @app.route('/queries/<int:n>')
+    def run_queries(n):
+        session = Session()
+        try:
+            for i in range(n):
+                session.execute('select {}'.format(i))
+        finally:
+            session.close()
+        return jsonify({'queries': n})
+
+    @app.route('/stream/<int:n>')
+    def stream_queries(n):
+        session = Session()
+
+        def rows():
+            try:
+                for i in range(n):
+                    yield session.execute('select {}'.format(i)).scalar()
+            finally:
+                session.close()
+
+        return stream_json(rows(), lambda value: value)
+
+    @app.route('/fails')
+    def fail():
+        session = Session()
+        try:
+            session.execute('select * from no_such_table')
+        except OperationalError:
+            pass
+        finally:
+            session.close()
+        return jsonify({})
+
+    return app
+
+
+def test_profile_headers():
+    client = make_app().test_client()
+    response = client.get('/queries/3')
+    assert response.headers['X-Query-Count'] == '3'
+    assert float(response.headers['X-Query-Time']) <= float(response.headers['X-Request-Time'])
+    assert client.get('/queries/0').headers['X-Query-Count'] == '0'
+
+
+def test_query_budget():
+    client = make_app(budget=2, strict=True).test_client()
+    assert client.get('/queries/2').status_code == 200
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/queries/3')
+
+
+def test_failed_statement():
+    client = make_app().test_client()
+    assert client.get('/fails').headers['X-Query-Count'] == '0'
+    assert client.get('/queries/1').headers['X-Query-Count'] == '1'
+    with engine.connect() as connection:
+        assert 'query_start_time' not in connection.info
+
+
+def test_streamed_response(caplog):
+    client = make_app().test_client()
+    with caplog.at_level(logging.INFO, logger='membership.web.profiling'):
+        response = client.get('/stream/3')
+        assert json.loads(response.get_data(as_text=True)) == [0, 1, 2]
+        response.close()
+    # The headers go out before the body is streamed, but the logged summary counts its queries
+    assert response.headers['X-Query-Count'] == '0'
+    summary = json.loads(caplog.records[-1].getMessage())
+    assert summary['path'] == '/stream/3'
+    assert summary['query_count'] == 3
@@ -0,0 +1,15 @@
+import json
+
+from membership.web.util import iter_json
+
+
+def test_iter_json():
+    rows = [(i, 'row {}'.format(i)) for i in range(5)]
+    chunks = list(iter_json(rows, list, chunk_size=2))
+    # The opening bracket, three chunks of rows and the closing bracket
+    assert len(chunks) == 5
+    assert json.loads(''.join(chunks)) == [list(row) for row in rows]
+    assert json.loads(''.join(iter_json(rows, tuple, keyed=True))) == \
+        {str(i): name for i, name in rows}
+    assert ''.join(iter_json([], tuple, keyed=True)) == '{}'
+    assert ''.join(iter_json([], list)) == '[]'
@@ -1,4 +1,14 @@
-from membership.util.vote import STVElection
+import random
+from decimal import getcontext
+
+import pytest
+from hypothesis import given
+from hypothesis.strategies import data
+import hypothesis.strategies as st
+
+from membership.util.vote import ArraySTVElection, GroupedSTVElection, IncrementalSTVElection, \
+    STVElection, ONE, analyze_tie_breaks, divide_weight, group_ballots, read_csv_ballots, \
+    read_json_ballots, scale_weight, to_decimal
 
 
 def test_transfer():
@@ -21,4 +31,106 @@ def test_tie_break():
     votes.extend([['Alice', 'Carol', 'Bob', 'Doug']]*6)
     election = STVElection(candidates, 2, votes)
     election.hold_election()
-    assert election.winners == ['Carol', 'Alice']
\ No newline at end of file
+    assert election.winners == ['Carol', 'Alice']
+
+
+ENGINES = [ArraySTVElection, IncrementalSTVElection, GroupedSTVElection]
+
+
+def assert_same_count(engine, candidates, num_winners, votes, seed=0):
+    random.seed(seed)
+    expected = STVElection(candidates, num_winners, votes)
+    expected.hold_election()
+    random.seed(seed)
+    election = engine(candidates, num_winners, votes)
+    election.hold_election()
+    assert election.winners == expected.winners
+    assert election.quota == expected.quota
+    assert [{c: {k: str(v) for k, v in info.items()} for c, info in r.items()}
+            for r in election.previous_rounds] == \
+        [{c: {k: str(v) for k, v in info.items()} for c, info in r.items()}
+         for r in expected.previous_rounds]
+    assert [list(r) for r in election.previous_rounds] == \
+        [list(r) for r in expected.previous_rounds]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_engine_matches(engine):
+    candidates = ['Alice', 'Bob', 'Carol', 'Doug']
+    votes = []
+    votes.extend([['Carol', 'Bob', 'Alice', 'Doug']]*10)
+    votes.extend([['Bob', 'Carol', 'Alice', 'Doug']]*4)
+    votes.extend([['Doug', 'Carol', 'Alice', 'Bob']]*1)
+    votes.extend([['Doug', 'Carol', 'Bob', 'Alice']]*1)
+    votes.extend([['Alice', 'Carol', 'Bob', 'Doug']]*6)
+    votes.append([])
+    assert_same_count(engine, candidates, 2, votes)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@given(data())
+def test_engine_matches_random(engine, data):
+    num_candidates = data.draw(st.integers(min_value=1, max_value=8))
+    candidates = list(range(num_candidates))
+    num_winners = data.draw(st.integers(min_value=1, max_value=num_candidates))
+    votes = data.draw(st.lists(st.lists(st.sampled_from(candidates), max_size=num_candidates,
+                                        unique=True), max_size=200))
+    assert_same_count(engine, candidates, num_winners, votes, seed=data.draw(st.integers()))
+
+
+def test_count_is_exact():
+    precision = getcontext().prec
+    candidates = ['Alice', 'Bob']
+    votes = [['Alice', 'Bob']] * 7 + [['Bob']] * 2
+    election = STVElection(candidates, 2, votes)
+    election.hold_election()
+    assert getcontext().prec == precision
+    # Alice's surplus of 3 over the quota of 4 moves to Bob at a weight of 0.42857 each
+    assert str(election.previous_rounds[1]['Bob']['total_votes']) == '4.99999'
+    assert str(election.previous_rounds[1]['Bob']['total_transfer_votes']) == '2.99999'
+
+
+def test_group_ballots():
+    votes = [['Alice', 'Bob'], ['Bob'], ('Alice', 'Bob'), [], ['Alice', 'Bob']]
+    assert sorted(group_ballots(votes)) == [((), 1), (('Alice', 'Bob'), 3), (('Bob',), 1)]
+    election = GroupedSTVElection(['Alice', 'Bob'], 1, votes)
+    assert len(election.votes) == 3
+    assert election.num_ballots == 5
+
+
+def test_analyze_tie_breaks():
+    votes = [['Alice', 'Bob'], ['Bob', 'Alice'], ['Carol']]
+    outcomes = analyze_tie_breaks(['Alice', 'Bob', 'Carol'], 1, votes, runs=200, processes=2)
+    assert sum(outcomes.values()) == 200
+    assert set(outcomes) == {frozenset(['Alice']), frozenset(['Bob'])}
+    assert analyze_tie_breaks(['Alice', 'Bob', 'Carol'], 1, votes, runs=200,
+                              processes=1) == outcomes
+
+    votes.append(['Alice'])
+    assert analyze_tie_breaks(['Alice', 'Bob', 'Carol'], 1, votes, runs=200) == \
+        {frozenset(['Alice']): 200}
+
+
+def test_read_ballots():
+    lines = ['["Carol", "Bob", "Alice"]\n', '\n', '["Alice"]\n']
+    assert list(read_json_ballots(lines)) == [['Carol', 'Bob', 'Alice'], ['Alice']]
+    assert list(read_csv_ballots(['Carol,Bob,Alice\n', 'Alice,,\n'])) == \
+        [['Carol', 'Bob', 'Alice'], ['Alice']]
+
+    # Every engine counts a generator of ballots in a single pass
+    votes = [['Carol', 'Bob', 'Alice']] * 20 + [['Alice', 'Carol', 'Bob']] * 5
+    for engine in [STVElection] + ENGINES:
+        election = engine(['Alice', 'Bob', 'Carol'], 2, (ranking for ranking in votes))
+        election.hold_election()
+        assert election.num_ballots == 25
+        assert election.winners == ['Carol', 'Bob']
+
+
+def test_fixed_point_weights():
+    assert scale_weight(ONE, 42857) == 42857
+    assert scale_weight(3, ONE // 2) == 2
+    assert scale_weight(5, ONE // 2) == 2
+    assert divide_weight(1, 3) == 33333
+    assert divide_weight(2, 3) == 66667
+    assert str(to_decimal(0)) == '0.00000'
+    assert str(to_decimal(1234567)) == '12.34567'